@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import time
+
+# import time budget in milliseconds for the modules used by short jobs
+IMPORT_BUDGET = {'country_data_scraping': 100,
+                 'scrapers.static_website_scraper': 50,
+                 'scrapers.website_fetcher': 50,
+                 'cleaners.string_cleaner': 20,
+                 'cleaners.format_cleaner': 20}
+
+# modules that must only be imported on first use
+HEAVY_MODULES = ['pandas', 'numpy', 'requests', 'bs4', 'html5lib', 'unicodedata2']
+
+
+def measure_import(module, repeat=5):
+    """Measure the import of a module in fresh interpreters.
+
+    Parameters:
+        module (str): name of the module
+        repeat (int): number of interpreters to start, the fastest run is used
+
+    Returns:
+        result (dict): import time and start-up time in ms and the heavy modules
+            that were imported
+
+    Raises:
+        ValueError: if the module can't be imported
+    """
+    src_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = ('import sys; import ' + module + '; '
+            'print(",".join(m for m in ' + repr(HEAVY_MODULES) + ' if m in sys.modules))')
+
+    result = {'module': module, 'import_ms': None, 'startup_ms': None}
+    for _ in range(repeat):
+
+        # start a fresh interpreter with the import profiler
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                 cwd=src_directory, capture_output=True, text=True)
+        startup_ms = (time.perf_counter() - start) * 1000
+        if process.returncode != 0:
+            raise ValueError('import of ' + module +
+                             ' failed: ' + process.stderr[-500:])
+
+        # the cumulative time of the module is in its own line of the profile
+        import_ms = None
+        for line in process.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                import_ms = int(fields[1]) / 1000
+
+        if result['import_ms'] is None or import_ms < result['import_ms']:
+            result['import_ms'] = import_ms
+        if result['startup_ms'] is None or startup_ms < result['startup_ms']:
+            result['startup_ms'] = startup_ms
+        result['heavy_modules'] = process.stdout.strip()
+
+    return result
+
+
+def main():
+    # measure each module against its budget
+    over_budget = False
+    for module, budget in IMPORT_BUDGET.items():
+        result = measure_import(module)
+        passed = result['import_ms'] <= budget and result['heavy_modules'] == ''
+        over_budget = over_budget or not passed
+        print('{0:<35} import {1:7.1f} ms (budget {2} ms)  start-up {3:7.1f} ms  heavy: {4}  {5}'.format(
+            module, result['import_ms'], budget, result['startup_ms'],
+            result['heavy_modules'] or '-', 'ok' if passed else 'FAILED'))
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
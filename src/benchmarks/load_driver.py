@@ -0,0 +1,193 @@
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import time
+
+import benchmarks.mock_wiki as mw
+import country_data_scraping as cds
+import scrapers.website_fetcher as wf
+
+
+def get_memory_mb():
+    """Get the resident memory of the current process.
+
+    Parameters:
+        None
+
+    Returns:
+        memory_mb (float): resident set size in megabytes, the peak where the current
+            size can't be read
+
+    Raises:
+        None
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def get_percentile(values, percentile):
+    """Get a percentile of a list of numbers by the nearest rank.
+
+    Parameters:
+        values (list): numbers
+        percentile (float): percentile between 0 and 100
+
+    Returns:
+        value (float): value at the percentile, None for an empty list
+
+    Raises:
+        None
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, int(round(percentile / 100 * len(values) + 0.5)) - 1))
+
+    return values[rank]
+
+
+def run_load(states, mode='pipeline', parts=cds.STATE_PARTS, server_settings=None,
+             sample_seconds=0.5):
+    """Scrape all states of a mock wiki and measure the run.
+
+    Parameters:
+        states (int): number of states the mock wiki generates
+        mode (str): "pipeline" for run_states_pipeline(), "sequential" for get_state_data()
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+        server_settings (dict): further keyword arguments of mw.create_mock_wiki()
+        sample_seconds (float): interval of the memory samples
+
+    Returns:
+        result (dict): throughput, latency percentiles in ms, memory curve and failures
+
+    Raises:
+        ValueError: if mode is not valid
+    """
+    if mode not in ('pipeline', 'sequential'):
+        raise ValueError('mode is not valid: ' + mode)
+
+    # serve the pages from a separate process, so that the server doesn't compete for the gil
+    context = multiprocessing.get_context('spawn')
+    parent_connection, child_connection = context.Pipe()
+    server = context.Process(target=mw.serve_mock_wiki, daemon=True,
+                             args=(child_connection, dict(server_settings or {}, states=states)))
+    server.start()
+    base_url = parent_connection.recv()
+
+    # point the scraper at the mock wiki, the original urls are restored at the end
+    urls = (cds.WIKIPEDIA_URL, cds.STATES_LIST_URL)
+    cds.WIKIPEDIA_URL = base_url
+    cds.STATES_LIST_URL = base_url + 'wiki/List_of_sovereign_states'
+
+    # time every request of the fetcher
+    latencies = []
+    request = wf.request
+
+    def timed_request(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return request(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    # sample the memory while the run goes on
+    memory_curve = []
+    finished = threading.Event()
+    start = time.perf_counter()
+
+    def sample_memory():
+        while not finished.is_set():
+            memory_curve.append((round(time.perf_counter() - start, 2), round(get_memory_mb(), 1)))
+            finished.wait(sample_seconds)
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    try:
+        wf.request = timed_request
+        sampler.start()
+        state_list = cds.get_selected_states()
+        list_seconds = time.perf_counter() - start
+        attributes_list = cds.get_attributes_list()
+        if mode == 'pipeline':
+            states_dict, errors = cds.run_states_pipeline(state_list, attributes_list, parts)
+        else:
+            states_dict = {}
+            errors = []
+            for state in state_list:
+                states_dict[state['name']] = cds.get_state_data(
+                    state['link'], attributes_list, {'name': state['name']}, parts, errors)
+        seconds = time.perf_counter() - start
+    finally:
+        finished.set()
+        if sampler.is_alive():
+            sampler.join()
+        wf.request = request
+        cds.WIKIPEDIA_URL, cds.STATES_LIST_URL = urls
+        server.terminate()
+        server.join()
+
+    result = {'states': states, 'mode': mode, 'scraped': len(states_dict),
+              'failures': len(errors), 'requests': len(latencies),
+              'seconds': round(seconds, 2), 'list_seconds': round(list_seconds, 2),
+              'states_per_second': round(len(states_dict) / seconds, 1),
+              'requests_per_second': round(len(latencies) / seconds, 1),
+              'peak_mb': max(memory for _, memory in memory_curve),
+              'memory_curve': memory_curve}
+    for percentile in (50, 90, 99):
+        latency = get_percentile(latencies, percentile)
+        result['p' + str(percentile) + '_ms'] = round(latency * 1000, 1) if latency is not None else None
+
+    return result
+
+
+def main(argv=None):
+    import argparse
+    import contextlib
+    import io
+
+    def comma_list(value):
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    parser = argparse.ArgumentParser(
+        description='Scrape a mock wiki at increasing scale and report throughput, latency and memory.')
+    parser.add_argument('--scales', type=comma_list, default=['200', '2000', '20000'],
+                        help='comma separated numbers of states, e.g. "200,2000,20000"')
+    parser.add_argument('--mode', choices=['pipeline', 'sequential'], default='pipeline')
+    parser.add_argument('--only', type=comma_list, default=list(cds.STATE_PARTS),
+                        help='comma separated parts to scrape: ' + ','.join(cds.STATE_PARTS))
+    parser.add_argument('--page-kb', type=int, default=100)
+    parser.add_argument('--extra-rows', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--missing-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='path to a json file with all results and memory curves')
+    arguments = parser.parse_args(argv)
+
+    server_settings = {'page_kb': arguments.page_kb, 'extra_rows': arguments.extra_rows,
+                       'latency': arguments.latency, 'error_rate': arguments.error_rate,
+                       'missing_rate': arguments.missing_rate}
+
+    # run each scale and keep the status output of the scraper out of the report
+    results = []
+    print('{0:>7} {1:>8} {2:>9} {3:>8} {4:>8} {5:>8} {6:>8} {7:>8} {8:>8}'.format(
+        'states', 'failures', 'seconds', 'states/s', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'peak MB'))
+    for scale in arguments.scales:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_load(int(scale), arguments.mode, tuple(arguments.only), server_settings)
+        results.append(result)
+        print('{states:>7} {failures:>8} {seconds:>9} {states_per_second:>8} {requests_per_second:>8} '
+              '{p50_ms:>8} {p90_ms:>8} {p99_ms:>8} {peak_mb:>8}'.format(**result))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+import http.server
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+# rows of the infobox that the attributes of country_data_scraping are matched in
+INFOBOX_ROWS = ['<tr class="mergedtoprow"><th>Capital<div>and largest city</div></th>'
+                '<td>{capital}<span style="display:none">{index}N</span></td></tr>',
+                '<tr class="mergedrow"><th>Official languages</th><td>{language}</td></tr>',
+                '<tr class="mergedtoprow"><th>Religion</th><td>{religion}% Christianity</td></tr>',
+                '<tr class="mergedtoprow"><th colspan="2">Area </th></tr>',
+                '<tr class="mergedrow"><th>• Total</th><td>{area:,} km2 ({area_mi:,} sq mi)</td></tr>',
+                '<tr class="mergedtoprow"><th colspan="2">Population</th></tr>',
+                '<tr class="mergedrow"><th>• 2023 estimate</th><td>{population:,}[5]</td></tr>',
+                '<tr class="mergedbottomrow"><th>• Density</th><td>{density}/km2</td></tr>',
+                '<tr><th>Currency</th><td>{currency} (¤)</td></tr>']
+
+
+def get_state_name(index):
+    """Get the name of a generated state.
+
+    Parameters:
+        index (int): number of the state
+
+    Returns:
+        name (str): name of the state, e.g. "State 12"
+
+    Raises:
+        None
+    """
+    return 'State ' + str(index)
+
+
+def get_list_page(states):
+    """Generate the list of states.
+
+    Parameters:
+        states (int): number of states
+
+    Returns:
+        page (str): html with a sortable wikitable of all states
+
+    Raises:
+        None
+    """
+    rows = ['<tr><th>Common and formal names</th><th>Membership</th>'
+            '<th>Sovereignty dispute</th><th>Further information</th></tr>']
+    for index in range(states):
+        name = get_state_name(index)
+        page_name = name.replace(' ', '_')
+        rows.append('<tr><td><b><a href="/wiki/' + page_name + '" title="' + name + '">' + name +
+                    '</a></b> – Republic of ' + name + '</td>'
+                    '<td><a href="/wiki/United_Nations_System">UN member state</a></td>'
+                    '<td>None</td><td>' + name + ' is a generated state.</td></tr>')
+
+    return ('<html><body><table class="sortable wikitable"><tbody>' + ''.join(rows) +
+            '</tbody></table></body></html>')
+
+
+def get_state_page(index, filler, extra_rows):
+    """Generate the article of a state with infobox, flag, map and filler text.
+
+    Parameters:
+        index (int): number of the state
+        filler (str): html that pads the article to its size
+        extra_rows (int): additional rows of the infobox that match no attribute
+
+    Returns:
+        page (str): html of the article
+
+    Raises:
+        None
+    """
+    name = get_state_name(index)
+    page_name = name.replace(' ', '_')
+    generator = random.Random(index)
+    area = generator.randint(100, 10000000)
+    population = generator.randint(1000, 1000000000)
+
+    values = {'index': index, 'capital': 'Capital ' + str(index),
+              'language': 'Language ' + str(index % 97),
+              'religion': generator.randint(1, 99), 'area': area,
+              'area_mi': int(area * 0.386), 'population': population,
+              'density': population // area, 'currency': 'Currency ' + str(index % 61)}
+    rows = ['<tr><th colspan="2">' + name + '</th></tr>']
+    rows += [row.format(**values) for row in INFOBOX_ROWS]
+    rows += ['<tr><th>Field ' + str(row) + '</th><td>Value ' + str(row) + ' of ' + name + '</td></tr>'
+             for row in range(extra_rows)]
+
+    images = ('<a class="image" href="/wiki/File:Flag_of_' + page_name + '.svg" title="Flag of ' + name + '">'
+              '<img src="//upload.wikimedia.org/wikipedia/commons/thumb/0/00/Flag_of_' + page_name +
+              '.svg/125px-Flag_of_' + page_name + '.svg.png" width="125" height="83" data-file-width="900"></a>'
+              '<a class="image" href="/wiki/File:' + page_name + '_(orthographic_projection).svg" '
+              'title="Location of ' + name + '"><img src="//upload.wikimedia.org/wikipedia/commons/thumb/0/00/' +
+              page_name + '_(orthographic_projection).svg/250px-' + page_name +
+              '_(orthographic_projection).svg.png" width="250" height="250" data-file-width="550"></a>')
+
+    return ('<html><head><title>' + name + '</title></head><body><h1>' + name + '</h1>'
+            '<table class="infobox ib-country vcard"><tbody>' + ''.join(rows) + '</tbody></table>' +
+            images + filler + '</body></html>')
+
+
+def get_file_page(file_name):
+    """Generate the File: page of an image with a link to the original file.
+
+    Parameters:
+        file_name (str): name of the file, e.g. "Flag_of_State_12.svg"
+
+    Returns:
+        page (str): html of the File: page
+
+    Raises:
+        None
+    """
+    return ('<html><body><h1>File:' + file_name + '</h1><div class="fullMedia">'
+            '<a href="//upload.wikimedia.org/wikipedia/commons/0/00/' + file_name +
+            '" class="internal" title="' + file_name + '">Original file</a></div></body></html>')
+
+
+def get_filler(page_kb):
+    """Generate paragraphs with links that pad an article to a size.
+
+    Parameters:
+        page_kb (int): size of the filler in kilobytes
+
+    Returns:
+        filler (str): html paragraphs
+
+    Raises:
+        None
+    """
+    paragraph = ('<p>Lorem ipsum dolor sit amet, <a href="/wiki/Consectetur" title="Consectetur">'
+                 'consectetur</a> adipiscing elit, sed do eiusmod tempor incididunt ut labore '
+                 '<a href="/wiki/Dolore" title="Dolore">et dolore</a> magna aliqua.<sup>[1]</sup></p>')
+
+    return paragraph * max(0, page_kb * 1024 // len(paragraph))
+
+
+class MockWikiHandler(http.server.BaseHTTPRequestHandler):
+    """Serve generated wikipedia pages with the settings of the server.
+
+    The server holds states, filler, extra_rows, latency, error_rate, missing_rate
+    and a seeded random generator.
+    """
+
+    def do_GET(self):
+        server = self.server
+
+        # delay the answer, exponentially distributed around the mean latency
+        with server.lock:
+            delay = server.generator.expovariate(
+                1.0 / server.latency) if server.latency > 0 else 0.0
+            error = server.generator.random()
+        time.sleep(delay)
+
+        # inject throttling and missing pages
+        if error < server.error_rate:
+            return self.send_page(503, 'service unavailable', {'Retry-After': '1'})
+        if error < server.error_rate + server.missing_rate:
+            return self.send_page(404, 'not found')
+
+        # repeated slashes come from joining the base url with absolute hrefs
+        path = urllib.parse.unquote(re.sub('/+', '/', self.path.split('?')[0]))
+        if path == '/wiki/List_of_sovereign_states':
+            return self.send_page(200, server.list_page)
+        match = re.fullmatch(r'/wiki/State_(\d+)', path)
+        if match and int(match.group(1)) < server.states:
+            return self.send_page(200, get_state_page(int(match.group(1)), server.filler, server.extra_rows))
+        if path.startswith('/wiki/File:'):
+            return self.send_page(200, get_file_page(path[len('/wiki/File:'):]))
+
+        return self.send_page(404, 'not found')
+
+    def send_page(self, status_code, page, headers={}):
+        body = page.encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def create_mock_wiki(states=200, page_kb=100, extra_rows=30, latency=0.0, error_rate=0.0,
+                     missing_rate=0.0, seed=0, port=0):
+    """Create a local server that generates the pages of a wikipedia with many states.
+
+    Parameters:
+        states (int): number of states in the list of states
+        page_kb (int): size of the filler text of each article in kilobytes
+        extra_rows (int): additional rows of each infobox that match no attribute
+        latency (float): mean delay of each response in seconds
+        error_rate (float): share of requests answered with 503 and Retry-After
+        missing_rate (float): share of requests answered with 404
+        seed (int): seed of the random delays and errors
+        port (int): port to listen on, a free port by default
+
+    Returns:
+        server (http.server.ThreadingHTTPServer): server, not started yet
+        base_url (str): url of the server with trailing slash
+
+    Raises:
+        OSError: if the port is in use
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), MockWikiHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 128
+    server.states = states
+    server.filler = get_filler(page_kb)
+    server.extra_rows = extra_rows
+    server.latency = latency
+    server.error_rate = error_rate
+    server.missing_rate = missing_rate
+    server.generator = random.Random(seed)
+    server.lock = threading.Lock()
+    server.list_page = get_list_page(states)
+
+    return server, 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+
+
+def serve_mock_wiki(connection, settings):
+    """Run a mock wiki in a child process and send its url back.
+
+    Parameters:
+        connection (multiprocessing.connection.Connection): pipe to the parent process
+        settings (dict): keyword arguments of create_mock_wiki()
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    server, base_url = create_mock_wiki(**settings)
+    connection.send(base_url)
+    server.serve_forever()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Serve generated wikipedia pages for load tests.')
+    parser.add_argument('--states', type=int, default=200)
+    parser.add_argument('--page-kb', type=int, default=100)
+    parser.add_argument('--extra-rows', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--missing-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8800)
+    arguments = parser.parse_args(argv)
+
+    server, base_url = create_mock_wiki(**{name: value for name, value in vars(arguments).items()})
+    print('serving ' + str(arguments.states) + ' states at ' + base_url)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,34 @@
-import unicodedata2 as uc
+def normalize_strings(values, form='NFKC'):
+    """Normalize the unicode strings of a column in one batch.
+
+    Parameters:
+        values (list): Cells of a column
+        form (str): Unicode normal form
+
+    Returns:
+        values (list): Cells with normalized strings, other cells are left untouched
+
+    Raises:
+        None
+    """
+    # pure ascii strings are already normalized, each other string is normalized once
+    normalized = {}
+    for value in values:
+        if isinstance(value, str) and not value.isascii() and value not in normalized:
+            normalized[value] = None
+
+    # skip columns without any non-ascii string
+    if not normalized:
+        return values
+
+    import unicodedata2 as uc
+
+    for value in normalized:
+        normalized[value] = uc.normalize(form, value)
+
+    values = [normalized.get(value, value) if isinstance(value, str) else value
+              for value in values]
+    return values
 
 
 def unicode_to_ascii(data):
@@ -13,5 +43,24 @@ def unicode_to_ascii(data):
     Raises:
         None
     """
-    data = data.applymap(lambda x: uc.normalize('NFKC', str(x)))
-    return data
+    import pandas as pd
+
+    # normalize column by column and only replace columns that changed
+    columns = []
+    changed = False
+    for position in range(data.shape[1]):
+        column = data.iloc[:, position]
+        values = column.tolist()
+        normalized = normalize_strings(values)
+        if normalized is not values:
+            column = pd.Series(normalized, index=data.index, dtype=column.dtype)
+            changed = True
+        columns.append(column)
+
+    if not changed:
+        return data.copy()
+
+    # rebuild by position, labels may repeat
+    result = pd.concat(columns, axis=1, ignore_index=True)
+    result.columns = data.columns
+    return result
@@ -0,0 +1,118 @@
+# pattern for the first quantity of a cell, e.g. "643,801 km2 (248,573 sq mi)",
+# "$3.764 trillion", "−12.5", "10–20%" or "-5 – -3", applied to whole columns at once
+NUMBER_PATTERN = (r'(?:(?P<sign>[-−])(?=[$€£¥\d]))?'
+                  r'(?P<currency>[$€£¥])?\s*'
+                  r'(?P<lower>\d[\d,]*(?:\.\d+)?)'
+                  r'(?:\s*[–—-]\s*(?:(?P<upper_sign>[-−])(?=\d))?(?P<upper>\d[\d,]*(?:\.\d+)?))?'
+                  r'\s*(?P<scale>thousand|million|billion|trillion)?'
+                  r'\s*(?P<unit>km2|km²|sq mi|mi2|/km2|%)?')
+
+SCALES = {'thousand': 1e3, 'million': 1e6, 'billion': 1e9, 'trillion': 1e12}
+
+
+def parse_numbers(series):
+    """Parse the first quantity of each string in a series.
+
+    Parameters:
+        series (pd.Series): Strings like "643,801 km2 (248,573 sq mi)", other values
+            are parsed as their string
+
+    Returns:
+        parsed (pd.DataFrame): Columns value, upper, unit and status
+            with one row per cell of the series
+
+    Raises:
+        None
+    """
+    import numpy as np
+    import pandas as pd
+
+    # drop footnotes like "[5]" before searching for numbers
+    strings = series.astype('object').where(series.notna())
+    strings = strings.where(strings.isna(), strings.astype(str))
+    strings = strings.str.replace(r'\[.*?\]', '', regex=True)
+    groups = strings.str.extract(NUMBER_PATTERN)
+
+    # convert the matched digits and apply the sign and the scale words
+    scale = groups['scale'].str.lower().map(SCALES).fillna(1.0)
+    sign = groups['sign'].notna().map({True: -1.0, False: 1.0})
+    upper_sign = groups['upper_sign'].notna().map({True: -1.0, False: 1.0})
+    lower = pd.to_numeric(groups['lower'].str.replace(
+        ',', '', regex=False), errors='coerce') * scale * sign
+    upper = pd.to_numeric(groups['upper'].str.replace(
+        ',', '', regex=False), errors='coerce') * scale * upper_sign
+
+    # prefer the measuring unit and fall back to the currency symbol
+    unit = groups['unit'].str.replace('²', '2', regex=False)
+    unit = unit.where(unit.notna(), groups['currency'])
+
+    # set a parse status for each cell
+    status = np.select(
+        [strings.isna() | (strings.str.strip() == ''),
+         lower.isna(),
+         upper.notna()],
+        ['missing', 'unparsed', 'range'],
+        default='ok')
+
+    parsed = pd.DataFrame({'value': lower.astype('float64'),
+                           'upper': upper.where(upper.notna(), lower).astype('float64'),
+                           'unit': unit,
+                           'status': status},
+                          index=series.index)
+
+    return parsed
+
+
+def normalize_numbers(df, columns):
+    """Add typed numeric columns for columns with quantities in text.
+
+    Parameters:
+        df (pd.DataFrame): Dataframe
+        columns (list): Names of columns to parse
+
+    Returns:
+        df (pd.DataFrame): Dataframe with the additional columns
+            <column>_value, <column>_upper, <column>_unit and <column>_status
+
+    Raises:
+        None
+    """
+    # parse each column in one batch and append the results
+    for column in columns:
+        parsed = parse_numbers(df[column])
+        for parsed_column in parsed.columns:
+            df[column + '_' + parsed_column] = parsed[parsed_column]
+
+    return df
+
+
+def test_parse_numbers():
+    import pandas as pd
+
+    parsed = parse_numbers(pd.Series(['643,801 km2 (248,573 sq mi)', '−12.5', '-5 – -3',
+                                      '10–20%', '$3.764 trillion', None]))
+
+    # testcase: first quantity with unit and negative values
+    assert_data = [643801.0, -12.5, -5.0, 10.0, 3.764e12]
+    test_data = parsed['value'].tolist()[:5]
+    assert test_data == assert_data, "Test expected " + str(assert_data) + " but got " + str(test_data)
+
+    # testcase: range with a negative upper bound
+    assert_data = (-3.0, 'range')
+    test_data = (parsed.loc[2, 'upper'], parsed.loc[2, 'status'])
+    assert test_data == assert_data, "Test expected " + str(assert_data) + " but got " + str(test_data)
+
+    # testcase: missing cell and numeric series
+    assert parsed.loc[5, 'status'] == 'missing', "Test expected 'missing' but got " + parsed.loc[5, 'status']
+    test_data = parse_numbers(pd.Series([1, 2.5]))['value'].tolist()
+    assert test_data == [1.0, 2.5], "Test expected [1.0, 2.5] but got " + str(test_data)
+
+    print("parse_numbers was tested successfully.")
+
+
+def main():
+    test_parse_numbers()
+
+
+if __name__ == '__main__':
+    main()
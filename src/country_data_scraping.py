@@ -1,12 +1,38 @@
+import concurrent.futures
+import functools
+import json
+import os
+import threading
 import warnings
 
-import pandas as pd
-
+import cleaners.number_cleaner as nc
 import cleaners.string_cleaner as sc
+import crawlers.work_queue as wq
+import exporters.anki_exporter as ae
+import exporters.stream_writer as sw
+import matchers.feature_matcher as fm
+import pipelines.stage_pipeline as sp
+import scrapers.media_scraper as ms
 import scrapers.static_website_scraper as sws
+import scrapers.website_fetcher as wf
 
 # TODO: search routine testen mit test urls und dabei die phrases anpassen
 
+WIKIPEDIA_URL = "https://en.wikipedia.org/"
+STATES_LIST_URL = "https://en.wikipedia.org/wiki/List_of_sovereign_states"
+STATE_PARTS = ('attributes', 'flag', 'map')
+OVERRIDES_PATH = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'state_overrides.json')
+ERROR_COLUMNS = ['name', 'url', 'part', 'stage',
+                 'reason', 'kind', 'attempts', 'resolved']
+
+# threads that scrape the parts of a state, kept for the whole run to reuse their connections
+_part_executor = {'executor': None, 'lock': threading.Lock()}
+
+# a forked worker process has none of these threads
+os.register_at_fork(after_in_child=lambda: _part_executor.update(
+    executor=None, lock=threading.Lock()))
+
 
 def get_states_list():
     """Scrape a list of states from Wikipedia.
@@ -26,7 +52,7 @@ def get_states_list():
 
     # scrapte table of states
     scraped_tables = sws.scrape_tables(
-        url="https://en.wikipedia.org/wiki/List_of_sovereign_states",
+        url=STATES_LIST_URL,
         table_attributes={'class': 'sortable wikitable'},
         append_links=True)
 
@@ -39,9 +65,10 @@ def get_states_list():
     scraped_table = scraped_tables[0]
 
     # set up dataframe with selected data
+    import pandas as pd
     df = pd.DataFrame()
     df['name'] = scraped_table.iloc[1:, 0]
-    df['links'] = scraped_table.iloc[1:, 4]
+    df['links'] = scraped_table.iloc[1:, -1]
     df['sovereignityDispute'] = scraped_table.iloc[1:, 2] + \
         " - " + scraped_table.iloc[1:, 3]
 
@@ -56,7 +83,7 @@ def get_states_list():
 
     # select the first link and add domain name
     for index in range(df.shape[0]):
-        df['links'].iloc[index] = "https://en.wikipedia.org/" + \
+        df['links'].iloc[index] = WIKIPEDIA_URL + \
             df['links'].iloc[index][0]
 
     return df
@@ -74,12 +101,21 @@ def get_attributes_list():
     return attributes
 
 
-def get_state_attributes(link, attributes):
+def get_numeric_attributes():
+    attributes = ['area_total',
+                  'population_estimate']
+
+    return attributes
+
+
+def get_state_attributes(link, attributes, selectors=None):
     """Scrape a attributes of a state from Wikipedia.
 
     Parameters:
         link (str): url to wikipedia page of state
         attributes (list): attributes to search for
+        selectors (dict): attribute as key and patterns for category and row as value,
+            see load_overrides()
 
     Returns:
         state_attributes (dict): key value pairs for state attributes
@@ -92,69 +128,99 @@ def get_state_attributes(link, attributes):
     print("started: get_state_attributes() for " + link)
 
     # scrape table of specific state
-    scraped_table = sws.scrape_tables(
+    scraped_tables = sws.scrape_tables(
         url=link,
         table_attributes={'class': 'infobox ib-country vcard'},
-        append_links=False)
+        append_links=False,
+        append_categories=True,
+        pre_slice=True)
+
+    return match_state_attributes(scraped_tables, link, attributes, selectors)
+
+
+def match_state_attributes(scraped_tables, link, attributes, selectors=None):
+    """Match attributes of a state in the scraped infobox.
 
+    Parameters:
+        scraped_tables (list): infobox tables from scrape_tables() with categories
+        link (str): url to wikipedia page of state
+        attributes (list): attributes to search for
+        selectors (dict): attribute as key and patterns for category and row as value,
+            used instead of the attribute name, see load_overrides()
+
+    Returns:
+        state_attributes (dict): key value pairs for state attributes
+
+    Raises:
+        ValueError: no table or match found when searching
+        Warning: more than one or match table found when searching
+    """
     # check validity of scraped table
-    if len(scraped_table) == 0:
+    if len(scraped_tables) == 0:
         raise ValueError('no table found. adjust url or table attributes.')
-    elif len(scraped_table) != 1:
+    elif len(scraped_tables) != 1:
         warnings.warn(
             'more than one table found. first one was selected. adjust table attributes.')
-    scraped_table = scraped_table[0]
+    scraped_table = scraped_tables[0]
 
     # set up dict for state attributes
     state_attributes = {'link': link}
 
+    # find the rows of all attributes in one pass with the compiled matcher
+    matched_attributes = [attribute for attribute in attributes
+                          if not (selectors and attribute in selectors)]
+    matcher = fm.load_attribute_matcher(tuple(matched_attributes))
+    categories = [category if isinstance(category, str) else ''
+                  for category in scraped_table['category'].tolist()]
+    labels = [label if isinstance(label, str) else '' for label in scraped_table.iloc[:, 0].tolist()]
+    values = scraped_table.iloc[:, 1].tolist()
+    rows = dict(zip(matched_attributes, matcher.find_rows(categories, labels)))
+
     # search for pre-defined attributes
     for attribute in attributes:
 
-        # adjust search behaviour if nested attribute
-        if '_' in attribute:
-
-            # match the first level of the attribute
-            sub_attributes = attribute.split('_')
-            first_level_match = scraped_table[scraped_table.iloc[:, 0].str.contains(
-                sub_attributes[0], case=False)]
-
-            # check validity of first level match
-            if first_level_match.shape[0] == 0:
+        # select the row by the patterns of an override
+        if selectors and attribute in selectors:
+            attribute_match = scraped_table
+            if 'category' in selectors[attribute]:
+                attribute_match = attribute_match[attribute_match['category'].str.contains(
+                    selectors[attribute]['category'], case=False, na=False)]
+            if 'row' in selectors[attribute]:
+                attribute_match = attribute_match[attribute_match.iloc[:, 0].str.contains(
+                    selectors[attribute]['row'], case=False, na=False)]
+
+            # check validity of the override match
+            if attribute_match.shape[0] == 0:
                 raise ValueError(
-                    'no match found for the first level of the nested attribute:' + attribute)
-            elif first_level_match.shape[0] != 1:
-                warnings.warn(
-                    'more than one match found for first level of the nested attribute:' + attribute)
-
-            # match the second level of the attribute
-            first_level_match_table = scraped_table.iloc[first_level_match.index[0]:, :]
-            second_level_match = first_level_match_table[first_level_match_table.iloc[:, 0].str.contains(
-                sub_attributes[1], case=False)]
-
-            # check validity of first level match
-            if second_level_match.shape[0] == 0:
+                    'no match found for the override of the attribute:' + attribute)
+            state_attributes[attribute] = attribute_match.iloc[0, 1]
+
+        # adjust search behaviour if nested attribute
+        elif '_' in attribute:
+
+            # check validity of the matches of both levels
+            if not rows[attribute]:
+                category_ids = matcher.category_patterns[matched_attributes.index(attribute)]
+                if not any(matcher.match_label(str(category)) & category_ids
+                           for category in categories):
+                    raise ValueError(
+                        'no match found for the first level of the nested attribute:' + attribute)
                 raise ValueError(
                     'no match found for the second level of the nested attribute:' + attribute)
 
             # select first match as the final attribute match
-            attribute_match = second_level_match
+            state_attributes[attribute] = values[rows[attribute][0]]
 
         else:
-            # match the attribute
-            attribute_match = scraped_table[scraped_table.iloc[:, 0].str.contains(
-                attribute, case=False)]
-
             # check validity of found values
-            if attribute_match.shape[0] == 0:
+            if not rows[attribute]:
                 raise ValueError(
                     'no match found for the attribute:' + attribute)
-            attribute_match = pd.DataFrame(
-                [attribute_match.iloc[0, 0], attribute_match.iloc[:, 1].str.cat(sep=' ')]).T
-            # elif attribute_match.shape[0] != 1:
 
-        # add attributes and values to dict
-        state_attributes[attribute] = attribute_match.iloc[0, 1]
+            # join the values of all matching rows
+            state_attributes[attribute] = ' '.join(
+                values[position] for position in rows[attribute]
+                if isinstance(values[position], str))
 
     return state_attributes
 
@@ -178,43 +244,56 @@ def get_state_flag(link):
     # scrape links of specific state
     scraped_links = sws.scrape_links(
         url=link,
-        link_attributes={'class': 'image'})
+        link_attributes={'class': 'image'},
+        as_frame=False)
+    flag_page = find_flag_page(scraped_links, link)
+
+    # scrape follow up links of an image to get the original
+    scraped_links = sws.scrape_links(
+        url=WIKIPEDIA_URL + flag_page,
+        link_attributes={'class': 'internal'},
+        as_frame=False)
+
+    # write url to flag to dict
+    state_flag = {'flag': find_original_file(scraped_links, link, 'flag')}
+
+    return state_flag
+
+
+def find_flag_page(scraped_links, link):
+    """Find the link to the File: page of the flag of a state.
+
+    Parameters:
+        scraped_links (list): image links of the page of the state
+        link (str): url to wikipedia page of state
+
+    Returns:
+        flag_page (str): href of the File: page
+
+    Raises:
+        ValueError: no match found when searching
+    """
+    titles = [str(scraped_link.get('title')) for scraped_link in scraped_links]
+    hrefs = [scraped_link['href'] for scraped_link in scraped_links]
 
     # search for link to the flag by title
     search_phrases = ['Flag', link.rsplit('/', 1)[-1].replace('_', ' ')]
-    flag_match = search_routine(
-        scraped_links['title'].astype(str), search_phrases)
+    flag_match = search_routine(titles, search_phrases)
 
     # get href of flag match
     if len(flag_match) == 1:
-        flag_match = scraped_links['href'][scraped_links['title']
-                                           == flag_match[0]].to_list()
+        flag_match = [href for title, href in zip(
+            titles, hrefs) if title == flag_match[0]]
 
     # search for link to the flag by href
     else:
         search_phrases = ['Flag', link.rsplit('/', 1)[-1]]
-        flag_match = search_routine(scraped_links.iloc[:, 0], search_phrases)
+        flag_match = search_routine(hrefs, search_phrases)
         if len(flag_match) == 0:
             raise ValueError(
                 'no match found for the flag of:' + link)
 
-    # scrape follow up links of an image to get the original
-    scraped_links = sws.scrape_links(
-        url='https://en.wikipedia.org/' + flag_match[0],
-        link_attributes={'class': 'internal'})
-
-    # check validity of results
-    if scraped_links.shape[0] == 0:
-        raise ValueError(
-            'no match found for the original link of the flag of:' + link)
-    elif scraped_links.shape[0] != 1:
-        warnings.warn(
-            'more than ona match found for the original link of the flag of:' + link)
-
-    # write url to flag to dict
-    state_flag = {'flag': scraped_links['href'].iloc[0]}
-
-    return state_flag
+    return flag_match[0]
 
 
 def get_state_map(link):
@@ -236,44 +315,116 @@ def get_state_map(link):
     # scrape links of specific state
     scraped_links = sws.scrape_links(
         url=link,
-        link_attributes={'class': 'image'})
+        link_attributes={'class': 'image'},
+        as_frame=False)
+    map_page = find_map_page(scraped_links, link)
+
+    # scrape follow up links of an image to get the original
+    scraped_links = sws.scrape_links(
+        url=WIKIPEDIA_URL + map_page,
+        link_attributes={'class': 'internal'},
+        as_frame=False)
+
+    # write url to map to dict
+    state_map = {'map': find_original_file(scraped_links, link, 'map')}
+
+    return state_map
+
+
+def find_map_page(scraped_links, link):
+    """Find the link to the File: page of the map of a state.
+
+    Parameters:
+        scraped_links (list): image links of the page of the state
+        link (str): url to wikipedia page of state
+
+    Returns:
+        map_page (str): href of the File: page
+
+    Raises:
+        ValueError: no match found when searching
+    """
+    titles = [str(scraped_link.get('title')) for scraped_link in scraped_links]
+    hrefs = [scraped_link['href'] for scraped_link in scraped_links]
 
     # search for link to the map by title
     search_phrases = ['Location']
-    map_match = search_routine(
-        scraped_links['title'].astype(str), search_phrases)
+    map_match = search_routine(titles, search_phrases)
 
     # get href of map match
     if len(map_match) == 1:
-        map_match = scraped_links['href'][scraped_links['title']
-                                          == map_match[0]].to_list()
+        map_match = [href for title, href in zip(
+            titles, hrefs) if title == map_match[0]]
 
     # search for link to the map by href
     else:
         search_phrases = ['orthographic', link.rsplit('/', 1)[-1], 'Location']
-        map_match = search_routine(
-            scraped_links['href'], search_phrases)
+        map_match = search_routine(hrefs, search_phrases)
         if len(map_match) == 0:
             raise ValueError(
                 'no match found for the map of:' + link)
 
-    # scrape follow up links of an image to get the original
-    scraped_links = sws.scrape_links(
-        url='https://en.wikipedia.org/' + map_match[0],
-        link_attributes={'class': 'internal'})
+    return map_match[0]
+
+
+def find_original_file(scraped_links, link, image):
+    """Find the link to the original file on a File: page.
+
+    Parameters:
+        scraped_links (list): internal links of the File: page
+        link (str): url to wikipedia page of state
+        image (str): name of the image for messages, e.g. "flag"
 
+    Returns:
+        original_file (str): url to the original file
+
+    Raises:
+        ValueError: no match found when searching
+        Warning: more than one match found when searching
+    """
     # check validity of results
-    if scraped_links.shape[0] == 0:
+    if len(scraped_links) == 0:
         raise ValueError(
-            'no match found for the original link of the flag of:' + link)
-    elif scraped_links.shape[0] != 1:
+            'no match found for the original link of the ' + image + ' of:' + link)
+    elif len(scraped_links) != 1:
         warnings.warn(
-            'more than ona match found for the original link of the flag of:' + link)
+            'more than ona match found for the original link of the ' + image + ' of:' + link)
 
-    # write url to map to dict
-    state_map = {'map': scraped_links['href'].iloc[0]}
+    return scraped_links[0]['href']
 
-    return state_map
+
+def get_states_media(df, directory='data/media', width=320, offline=False):
+    """Download the flags and maps of all states and add the stored files.
+
+    Parameters:
+        df (pd.DataFrame): states with the columns flag and map
+        directory (str): directory to store the files in
+        width (int): width of the rendered thumbnails, None for the originals
+        offline (bool): only use files of previous downloads
+
+    Returns:
+        df (pd.DataFrame): states with the additional columns flag_file and map_file
+
+    Raises:
+        None
+    """
+    # write status to console
+    print("started: get_states_media()")
+
+    # download flags and maps in one concurrent batch
+    media_urls = df['flag'].tolist() + df['map'].tolist()
+    if offline:
+        media = ms.find_media(media_urls, directory=directory, width=width)
+    else:
+        media = ms.download_media(
+            media_urls, directory=directory, width=width)
+    media_paths = dict(zip(media['url'], media['path']))
+
+    # add paths of the stored files
+    df['flag_file'] = df['flag'].map(media_paths)
+    df['map_file'] = df['map'].map(media_paths)
+
+    return df
 
 
 def search_routine(series, phrases, index_start=0, index_stop=1):
@@ -306,6 +457,461 @@ def search_routine(series, phrases, index_start=0, index_stop=1):
     return match
 
 
+def get_state_part(link, part, attributes_list, selectors=None):
+    """Scrape one part of a state.
+
+    Parameters:
+        link (str): url to wikipedia page of state
+        part (str): "attributes", "flag" or "map"
+        attributes_list (list): attributes to search for
+        selectors (dict): row selectors of the attributes, see load_overrides()
+
+    Returns:
+        part_dict (dict): key value pairs for the part
+
+    Raises:
+        ValueError: no table or match found when searching
+    """
+    if part == 'attributes':
+        return get_state_attributes(link, attributes_list, selectors)
+    if part == 'flag':
+        return get_state_flag(link)
+    return get_state_map(link)
+
+
+def get_state_data(link, attributes_list, state_dict=None, parts=STATE_PARTS, errors=None):
+    """Scrape attributes, flag and map of a single state.
+
+    Parameters:
+        link (str): url to wikipedia page of state
+        attributes_list (list): attributes to search for
+        state_dict (dict): known data of the state, e.g. name from get_states_list()
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+        errors (list): collects a failure of each part, see get_failure(), instead of raising it
+
+    Returns:
+        state_dict (dict): key value pairs for all data of the state
+
+    Raises:
+        ValueError: no table or match found when searching, if errors is None
+    """
+    state_dict = dict(state_dict or {}, link=link)
+
+    # fixed values of an override are not scraped
+    override = get_override(state_dict.get('name'))
+    values = override.get('values', {})
+    attributes_list = [attribute for attribute in attributes_list or []
+                       if attribute not in values]
+    parts = [part for part in STATE_PARTS if part in parts and part not in values and
+             (part != 'attributes' or attributes_list)]
+
+    # scrape concurrently, the page of the state is only fetched once
+    with _part_executor['lock']:
+        if _part_executor['executor'] is None:
+            _part_executor['executor'] = concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(STATE_PARTS), thread_name_prefix='state-part')
+        executor = _part_executor['executor']
+    futures = [(part, executor.submit(get_state_part, link, part, attributes_list,
+                                      override.get('attributes')))
+               for part in parts]
+    for part, future in futures:
+        try:
+            state_dict.update(future.result())
+        except Exception as error:
+            if errors is None:
+                raise
+            errors.append(get_failure(
+                state_dict.get('name'), link, part, error))
+    state_dict.update(values)
+
+    return state_dict
+
+
+@functools.lru_cache(maxsize=None)
+def load_overrides(path=OVERRIDES_PATH):
+    """Read the overrides of states that need special handling.
+
+    The file is a json object with the name of a state as key. Each override may hold
+    "link", an alternate url to the page of the state, "attributes", patterns for the
+    "category" and the "row" of the infobox to match an attribute in, and "values",
+    fixed values of attributes, flag or map that are not scraped at all.
+
+    Parameters:
+        path (str): path to the json file
+
+    Returns:
+        overrides (dict): lowercase name of a state as key and its override as value
+
+    Raises:
+        ValueError: if the file is not valid json
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as overrides_file:
+        overrides = json.load(overrides_file)
+
+    return {name.lower(): override for name, override in overrides.items()}
+
+
+def get_override(name):
+    """Get the override of a state.
+
+    Parameters:
+        name (str): name of the state, e.g. "Malaysia" or "Netherlands – Kingdom of the Netherlands"
+
+    Returns:
+        override (dict): link, attributes and values of the override, empty if there is none
+
+    Raises:
+        None
+    """
+    # names in the list of states also hold the formal name after a dash
+    overrides = load_overrides()
+    name = str(name).lower()
+
+    return overrides.get(name, overrides.get(name.split(' – ')[0].strip(), {}))
+
+
+def get_failure(name, url, part, error, stage=None):
+    """Describe a failed part of a state as a row of the error table.
+
+    Parameters:
+        name (str): name of the state
+        url (str): url to wikipedia page of state
+        part (str): failed part, "attributes", "flag", "map" or "state" for all parts
+        error (Exception): raised exception
+        stage (str): stage the error was raised in, "fetch" or "extract" by type of the error
+
+    Returns:
+        failure (dict): name, url, part, stage, reason, kind ("transient" or "permanent"),
+            attempts and resolved
+
+    Raises:
+        None
+    """
+    transient = wf.is_transient_error(error)
+    if stage is None:
+        stage = 'fetch' if transient or isinstance(
+            error, wf.PageError) else 'extract'
+
+    reason = type(error).__name__ + ': ' + str(error)
+    if getattr(error, 'status_code', None) is not None:
+        reason += ' (status ' + str(error.status_code) + ')'
+
+    failure = {'name': name, 'url': url, 'part': part, 'stage': stage,
+               'reason': reason,
+               'kind': 'transient' if transient else 'permanent',
+               'attempts': 1, 'resolved': False}
+
+    return failure
+
+
+def retry_failures(states_dict, errors, attributes_list, parts=STATE_PARTS, max_attempts=3,
+                   backoff_seconds=2.0):
+    """Retry the transient failures of a run in rounds with exponential backoff.
+
+    Parameters:
+        states_dict (dict): name of a state as key and its data as value, updated in place
+        errors (list): failures from get_failure(), updated in place
+        attributes_list (list): attributes to search for
+        parts (tuple): parts to retry for a failed page of a state
+        max_attempts (int): attempts of a part including the first one
+        backoff_seconds (float): wait before the first round, doubled for each further round
+
+    Returns:
+        resolved (int): number of failures that succeeded on a retry
+
+    Raises:
+        None
+    """
+    import time
+
+    resolved = 0
+    for attempt in range(2, max_attempts + 1):
+        pending = [failure for failure in errors
+                   if failure['kind'] == 'transient' and not failure['resolved']]
+        if not pending:
+            break
+
+        # give the hosts some time before the next round
+        time.sleep(backoff_seconds * 2 ** (attempt - 2))
+        for failure in pending:
+            print('retry ' + str(attempt) + ': ' +
+                  failure['part'] + ' of ' + failure['url'])
+            failed_parts = parts if failure['part'] == 'state' else (
+                failure['part'],)
+            state_dict = states_dict.get(failure['name'], {'name': failure['name']})
+            part_errors = []
+            state_dict = get_state_data(
+                failure['url'], attributes_list, state_dict, failed_parts, part_errors)
+
+            # keep what succeeded and the latest reason of what didn't
+            failure['attempts'] = attempt
+            if part_errors:
+                failure.update({key: part_errors[0][key]
+                                for key in ['part', 'stage', 'reason', 'kind']})
+                for part_error in part_errors[1:]:
+                    errors.append(dict(part_error, attempts=attempt))
+            else:
+                failure['resolved'] = True
+                resolved += 1
+            states_dict[failure['name']] = state_dict
+
+    return resolved
+
+
+def export_errors(errors, output_path='data/errors.csv'):
+    """Write the error table of a run.
+
+    Parameters:
+        errors (list): failures from get_failure()
+        output_path (str): path to the csv file
+
+    Returns:
+        df (pd.DataFrame): one row per failed part of a state
+
+    Raises:
+        None
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(errors, columns=ERROR_COLUMNS)
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    df.to_csv(output_path, index=False, sep=';')
+
+    # write status to console
+    unresolved = df[~df['resolved']]
+    print(str(len(unresolved)) + ' failures (' +
+          str((unresolved['kind'] == 'permanent').sum()) + ' permanent) written to ' + output_path)
+
+    return df
+
+
+def run_states_pipeline(states, attributes_list, parts=STATE_PARTS, workers=None, queue_size=16,
+                        on_state=None):
+    """Scrape states with separate worker pools for fetching, parsing, extracting and cleaning.
+
+    The stages are connected by bounded queues. The File: pages of flag and map are
+    fetched as soon as the page of their state has been extracted.
+
+    Parameters:
+        states (list): dicts with name, link and sovereignityDispute from get_selected_states()
+        attributes_list (list): attributes to search for
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+        workers (dict): stage name as key and number of workers as value
+        queue_size (int): number of items each queue holds before earlier stages wait
+        on_state (function): called with the data of each state as soon as it is finished
+
+    Returns:
+        states_dict (dict): name of a state as key and its data as value, states with
+            failed parts hold the parts that succeeded
+        errors (list): failures of the states, see get_failure()
+
+    Raises:
+        None
+    """
+    workers = dict({'fetch': 8, 'parse': 2, 'extract': 2,
+                    'clean': 1}, **(workers or {}))
+    file_parts = [part for part in ['flag', 'map'] if part in parts]
+
+    # each state is finished once its page and all of its File: pages arrived,
+    # fixed values of overrides are neither scraped nor waited for
+    collected = {}
+    for state in states:
+        values = get_override(state['name']).get('values', {})
+        collected[state['name']] = {'state_dict': dict(state, **values), 'failures': [],
+                                    'remaining': 1 + len([part for part in file_parts
+                                                          if part not in values])}
+
+    def fetch(job):
+        job['page'] = wf.get_page(job['url']).text
+        return [('parse', job)]
+
+    def parse(job):
+        job['soup'] = sws.parse_page(job.pop('page'))
+        return [('extract', job)]
+
+    def extract(job):
+        soup = job.pop('soup')
+
+        # original file on a File: page
+        if job['kind'] != 'state':
+            scraped_links = sws.extract_links(
+                soup, job['url'], {'class': 'internal'}, as_frame=False)
+            original_file = find_original_file(
+                scraped_links, job['link'], job['kind'])
+            return [('clean', {'name': job['name'], 'data': {job['kind']: original_file}})]
+
+        # attributes of the infobox and follow-up fetches of the File: pages,
+        # each part fails on its own like in get_state_data()
+        outputs = []
+        data = {}
+        part_failures = []
+        override = get_override(job['name'])
+        values = override.get('values', {})
+        state_attributes = [attribute for attribute in attributes_list or []
+                            if attribute not in values]
+        state_file_parts = [part for part in file_parts if part not in values]
+        if 'attributes' in parts and state_attributes:
+            try:
+                scraped_tables = sws.extract_tables(soup, {'class': 'infobox ib-country vcard'},
+                                                    append_categories=True)
+                data.update(match_state_attributes(
+                    scraped_tables, job['link'], state_attributes, override.get('attributes')))
+            except Exception as error:
+                part_failures.append(get_failure(job['name'], job['link'], 'attributes', error, 'extract'))
+        if state_file_parts:
+            scraped_links = sws.extract_links(
+                soup, job['url'], {'class': 'image'}, as_frame=False)
+            for part, find_page in [('flag', find_flag_page), ('map', find_map_page)]:
+                if part not in state_file_parts:
+                    continue
+                try:
+                    file_page = WIKIPEDIA_URL + find_page(scraped_links, job['link'])
+                except Exception as error:
+                    # the clean stage still counts the part as arrived
+                    outputs.append(('clean', {'name': job['name'], 'data': {}, 'failures': [
+                        get_failure(job['name'], job['link'], part, error, 'extract')]}))
+                    continue
+                outputs.append(('fetch', {'kind': part, 'name': job['name'], 'link': job['link'],
+                                          'url': file_page}))
+        outputs.append(('clean', {'name': job['name'], 'data': data, 'failures': part_failures}))
+
+        return outputs
+
+    def clean(job):
+        record = collected[job['name']]
+        record['state_dict'].update(job['data'])
+        record['failures'] += job.get('failures', [])
+        record['remaining'] -= 1
+        if record['remaining'] == 0:
+            # states with failed parts are passed on after the retries
+            if on_state is not None and not record['failures']:
+                on_state(record['state_dict'])
+            return [(None, record['state_dict'])]
+        return []
+
+    # run the stages, the clean stage owns the collected records
+    source = [('fetch', {'kind': 'state', 'name': state['name'], 'link': state['link'],
+                         'url': state['link']})
+              for state in states]
+    stages = [('fetch', fetch, workers['fetch']),
+              ('parse', parse, workers['parse']),
+              ('extract', extract, workers['extract']),
+              ('clean', clean, 1)]
+    results, errors, statistics = sp.run_pipeline(source, stages, queue_size)
+
+    # write status to console
+    for name, statistic in statistics.items():
+        print('stage ' + name + ': ' + str(statistic['items']) + ' items, ' +
+              '{0:.1f}'.format(statistic['busy_seconds']) + ' s busy')
+    for error in errors:
+        print('failed: ' + error['item'].get('url', error['item'].get('name', '')) +
+              ' in stage ' + error['stage'] + ' (' + repr(error['error']) + ')')
+
+    # a failed page of a state fails all of its parts, a failed File: page only its own,
+    # an item of the clean stage carries only the name of its state
+    failures = [failure for record in collected.values() for failure in record['failures']]
+    for error in errors:
+        item = error['item']
+        failures.append(get_failure(item['name'], collected[item['name']]['state_dict']['link'],
+                                    item.get('kind', 'state'), error['error'], error['stage']))
+
+    states_dict = {name: record['state_dict']
+                   for name, record in collected.items()}
+
+    return states_dict, failures
+
+
+def get_selected_states(countries=None):
+    """Get name and link of the states to scrape.
+
+    Parameters:
+        countries (list): names of wikipedia pages of states, None for all sovereign states
+
+    Returns:
+        states (list): dicts with name, link and sovereignityDispute of each state
+
+    Raises:
+        ValueError: no table found using scape_tables()
+    """
+    # build the links of selected states without loading the list of states
+    if countries:
+        states = [{'name': country.strip().replace('_', ' '),
+                   'link': WIKIPEDIA_URL + 'wiki/' + country.strip().replace(' ', '_'),
+                   'sovereignityDispute': ''}
+                  for country in countries]
+    else:
+        states_list = get_states_list()
+        states = [{'name': row['name'], 'link': row['links'],
+                   'sovereignityDispute': row['sovereignityDispute']}
+                  for _, row in states_list.iterrows()]
+
+    # follow alternate links of overrides, so that the right page is fetched once
+    for state in states:
+        state['link'] = get_override(state['name']).get('link', state['link'])
+
+    return states
+
+
+def plan_requests(countries=None, parts=STATE_PARTS, archive=None):
+    """List the requests a run would make, without making any of them.
+
+    Pages with a snapshot in the archive are marked, and the File: pages of flag and
+    map are resolved from snapshots of the page of a state.
+
+    Parameters:
+        countries (list): names of wikipedia pages of states, None for all sovereign states
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+        archive (SnapshotArchive): archive with snapshots of previous runs
+
+    Returns:
+        requests (list): tuples of url, purpose and source, which is "network" or "snapshot"
+
+    Raises:
+        None
+    """
+    def get_source(url):
+        return 'snapshot' if archive is not None and archive.contains(url) else 'network'
+
+    requests = []
+    if countries:
+        states = get_selected_states(countries)
+    else:
+        requests.append((STATES_LIST_URL, 'list of states',
+                        get_source(STATES_LIST_URL)))
+        states = [{'name': '<each state>', 'link': WIKIPEDIA_URL + 'wiki/<state>'}]
+
+    for state in states:
+        requests.append(
+            (state['link'], 'page of ' + state['name'], get_source(state['link'])))
+
+        # File: pages are only known from the page of the state
+        scraped_links = None
+        if get_source(state['link']) == 'snapshot':
+            soup = sws.parse_page(archive.get(state['link'])['content'])
+            scraped_links = sws.extract_links(
+                soup, state['link'], {'class': 'image'}, as_frame=False)
+        for part, find_page in [('flag', find_flag_page), ('map', find_map_page)]:
+            if part not in parts or part in get_override(state['name']).get('values', {}):
+                continue
+            file_page = None
+            if scraped_links is not None:
+                try:
+                    file_page = WIKIPEDIA_URL + \
+                        find_page(scraped_links, state['link'])
+                except ValueError:
+                    pass
+            if file_page is None:
+                file_page = '<File: page found on the page of ' + \
+                    state['name'] + '>'
+            requests.append(
+                (file_page, part + ' of ' + state['name'], get_source(file_page)))
+
+    return requests
+
+
 def test_some_url(url):
     attributes_list = get_attributes_list()
     state_dict = {'link': url}
@@ -316,41 +922,547 @@ def test_some_url(url):
     pass
 
 
-def main():
-    #test_url = 'https://en.wikipedia.org//wiki/Bahrain'
-    # test_some_url(test_url)
+def get_state_columns(attributes_list, parts=STATE_PARTS):
+    """Get the columns of a state row in the order of the export.
 
-    # init dict to collect dicts of individual states
-    states_dict = {}
+    Parameters:
+        attributes_list (list): scraped attributes
+        parts (tuple): scraped parts, any of "attributes", "flag" and "map"
 
-    # scrape list of states and attributes to scrape for each state
-    states_list = get_states_list()
-    attributes_list = get_attributes_list()
+    Returns:
+        columns (list): names of the columns
+
+    Raises:
+        None
+    """
+    columns = ['name', 'sovereignityDispute', 'link']
+    if 'attributes' in parts:
+        columns += list(attributes_list)
+    columns += [part for part in ['flag', 'map'] if part in parts]
 
-    # iterate over states
-    for _, row in states_list.iterrows():
+    return columns
 
-        # collect data about an individual state
-        state_dict = {'name': row['name'], 'link': row['links'],
-                      'sovereignityDispute': row['sovereignityDispute']}
-        state_dict.update(get_state_attributes(
-            state_dict['link'], attributes_list))
-        state_dict.update(get_state_flag(state_dict['link']))
-        state_dict.update(get_state_map(state_dict['link']))
 
-        # add state dict to a dict of all states
-        states_dict[row['name']] = state_dict
+def export_states(states_dict, attributes_list=None, output_path='data/export.csv', offline=False):
+    """Clean the data of all states and write csv, media and anki package.
+
+    Media and anki package are written next to the csv file, into media/ and deck.apkg.
 
-        print('hi')
+    Parameters:
+        states_dict (dict): name of a state as key and its data as value
+        attributes_list (list): scraped attributes, all attributes by default
+        output_path (str): path to the csv file
+        offline (bool): only use media files of previous downloads
+
+    Returns:
+        df (pd.DataFrame): states as rows and data as columns
+
+    Raises:
+        None
+    """
+    if attributes_list is None:
+        attributes_list = get_attributes_list()
+    output_directory = os.path.dirname(output_path)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    media_directory = os.path.join(output_directory, 'media')
 
     # dict of dict to dataframe
+    import pandas as pd
+    df = pd.DataFrame.from_dict(states_dict, orient='index')
+
+    # fix the order of the columns, parts are merged in the order they finished,
+    # further columns of the attributes follow the attributes
+    columns = [column for column in get_state_columns(attributes_list) if column in df]
+    extra_columns = [column for column in df if column not in columns]
+    position = len(columns) - len([part for part in ['flag', 'map'] if part in df])
+    df = df[columns[:position] + extra_columns + columns[position:]]
+
     # clean dataframe
+    df = nc.normalize_numbers(df, columns=[
+        attribute for attribute in get_numeric_attributes() if attribute in df])
+
+    # download flags and maps
+    if 'flag' in df and 'map' in df:
+        df = get_states_media(df, media_directory, offline=offline)
+
+    # write notes and media directly into an anki package
+    ae.export_deck(df, fields=[attribute for attribute in attributes_list if attribute in df],
+                   media_fields={'flag': 'flag_file', 'map': 'map_file'},
+                   collection_path=os.path.join(output_directory, 'deck.anki2'),
+                   package_path=os.path.join(output_directory, 'deck.apkg'),
+                   media_directory=media_directory)
+
+    df.to_csv(output_path, header=False, index=False, sep=';')
 
-    df.to_csv('data/export.csv', header=False, index=False, sep=';')
+    return df
+
+
+def queue_states(queue_path, countries=None, attributes_list=None, parts=STATE_PARTS):
+    """Load the list of states into a shared work queue.
+
+    States of an earlier run on the same queue are queued again with the current selection.
+
+    Parameters:
+        queue_path (str): path to the sqlite file of the queue
+        countries (list): names of wikipedia pages of states, None for all sovereign states
+        attributes_list (list): attributes to search for, all attributes by default
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+
+    Returns:
+        urls (list): links of the queued states
+
+    Raises:
+        None
+    """
+    if attributes_list is None:
+        attributes_list = get_attributes_list()
+
+    # the selection is passed to the workers with each state
+    states = get_selected_states(countries)
+    payloads = [{'name': state['name'], 'sovereignityDispute': state['sovereignityDispute'],
+                 'attributes': attributes_list, 'parts': list(parts)}
+                for state in states]
+
+    connection = wq.open_queue(queue_path)
+    urls = [state['link'] for state in states]
+    try:
+        wq.enqueue(connection, urls, payloads, requeue=True)
+    finally:
+        connection.close()
+
+    return urls
+
+
+def process_queued_state(link, payload):
+    """Scrape a state claimed from the work queue.
+
+    Parameters:
+        link (str): url to wikipedia page of state
+        payload (dict): name, sovereignity dispute and selected attributes and parts
+
+    Returns:
+        result (dict): "state", the data of the state, and "errors", the failures of its
+            parts, see get_failure()
+
+    Raises:
+        None
+    """
+    payload = dict(payload)
+    attributes_list = payload.pop('attributes', get_attributes_list())
+    parts = payload.pop('parts', STATE_PARTS)
+
+    # failed parts are stored with the result and retried by main_distributed()
+    errors = []
+    state_dict = get_state_data(link, attributes_list, payload, parts, errors)
+
+    return {'state': state_dict, 'errors': errors}
+
+
+def run_state_worker(queue_path, worker_id=None):
+    """Work on the queued states until the queue is drained.
+
+    Can be started on any number of processes or nodes that share the queue file.
+
+    Parameters:
+        queue_path (str): path to the sqlite file of the queue
+        worker_id (str): name of the worker
+
+    Returns:
+        processed (int): number of states scraped by this worker
+
+    Raises:
+        None
+    """
+    return wq.run_worker(queue_path, process_queued_state, worker_id)
+
+
+def main_distributed(queue_path='data/queue.sqlite', processes=4, countries=None,
+                     attributes_list=None, parts=STATE_PARTS, output_path='data/export.csv',
+                     snapshots=None, on_state=None, errors_path='data/errors.csv'):
+    """Crawl states with local worker processes on a shared work queue.
+
+    Parameters:
+        queue_path (str): path to the sqlite file of the queue
+        processes (int): number of local worker processes
+        countries (list): names of wikipedia pages of states, None for all sovereign states
+        attributes_list (list): attributes to search for, all attributes by default
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+        output_path (str): path to the csv file
+        snapshots (tuple): directory, mode and replay time for use_snapshots() in each worker
+        on_state (function): called with the data of each state once a worker finished it
+        errors_path (str): path to the csv file with the failures
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    import multiprocessing
+
+    # fill the queue and let the workers drain it
+    urls = set(queue_states(queue_path, countries, attributes_list, parts))
+    with multiprocessing.Pool(processes, initializer=wf.use_snapshots if snapshots else None,
+                              initargs=snapshots or ()) as pool:
+        workers = pool.map_async(run_state_worker, [queue_path] * processes)
+
+        # pass on finished states while the workers are running,
+        # states with failed parts are passed on after the retries
+        if on_state is not None:
+            seen_ids = set()
+            connection = wq.open_queue(queue_path)
+            try:
+                while True:
+                    finished = workers.ready()
+                    for result in wq.get_new_results(connection, seen_ids, urls):
+                        if not result['errors']:
+                            on_state(result['state'])
+                    if finished:
+                        break
+                    workers.wait(5)
+            finally:
+                connection.close()
+        workers.get()
+
+    # collect the results of all workers
+    connection = wq.open_queue(queue_path)
+    try:
+        print(wq.get_progress(connection))
+        results = wq.get_results(connection, urls)
+    finally:
+        connection.close()
+    states_dict = {result['state']['name']: result['state'] for result in results}
+    errors = [failure for result in results for failure in result['errors']]
+
+    # retry the transient failures of all workers and record the rest
+    if errors:
+        retry_failures(states_dict, errors, attributes_list or get_attributes_list(), parts)
+        if on_state is not None:
+            for name in dict.fromkeys(failure['name'] for failure in errors):
+                on_state(states_dict[name])
+        export_errors(errors, errors_path)
+
+    export_states(states_dict, attributes_list, output_path,
+                  offline=bool(snapshots) and snapshots[1] == 'replay')
+
+
+def reprocess_state(state, attributes_list, parts):
+    """Extract a state from snapshots in a worker process of reprocess_states().
+
+    Parameters:
+        state (dict): name, link and sovereignityDispute of the state
+        attributes_list (list): attributes to search for
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+
+    Returns:
+        (state_dict, errors) (tuple): data of the state and the failures of its parts
+
+    Raises:
+        None
+    """
+    errors = []
+    state_dict = get_state_data(state['link'], attributes_list, {
+        'name': state['name'], 'sovereignityDispute': state['sovereignityDispute']}, parts, errors)
+
+    return state_dict, errors
+
+
+def reprocess_states(archive_directory, processes=4, countries=None, attributes_list=None,
+                     parts=STATE_PARTS, output_path='data/export.csv', at=None, on_state=None,
+                     errors_path='data/errors.csv'):
+    """Re-run the extraction over stored snapshots with a process pool and no network access.
+
+    Parameters:
+        archive_directory (str): directory of a snapshot archive of a previous run
+        processes (int): number of worker processes
+        countries (list): names of wikipedia pages of states, None for all sovereign states
+        attributes_list (list): attributes to search for, all attributes by default
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+        output_path (str): path to the csv file
+        at (float): unix time, use the latest snapshots fetched at or before it
+        on_state (function): called with the data of each state as soon as it is finished
+        errors_path (str): path to the csv file with the failures
+
+    Returns:
+        df (pd.DataFrame): states as rows and data as columns
+
+    Raises:
+        ValueError: if the list of states has no snapshot
+    """
+    import functools
+    import multiprocessing
+
+    if attributes_list is None:
+        attributes_list = get_attributes_list()
+
+    # read the list of states from the archive
+    wf.use_snapshots(archive_directory, 'replay', at)
+    states = get_selected_states(countries)
+
+    # extract all states in fresh processes that replay from the same archive
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(processes, mp_context=context,
+                                                initializer=wf.use_snapshots,
+                                                initargs=(archive_directory, 'replay', at)) as executor:
+        results = executor.map(functools.partial(reprocess_state, attributes_list=attributes_list,
+                                                 parts=parts), states, chunksize=4)
+        states_dict = {}
+        errors = []
+        for state_dict, state_errors in results:
+            for failure in state_errors:
+                print('failed: ' + failure['part'] + ' of ' +
+                      failure['url'] + ' (' + failure['reason'] + ')')
+            errors.extend(state_errors)
+            states_dict[state_dict['name']] = state_dict
+            if on_state is not None:
+                on_state(state_dict)
+
+    # snapshots don't change, so there is nothing to retry
+    if errors:
+        export_errors(errors, errors_path)
+
+    # write the same output as a live run
+    df = export_states(states_dict, attributes_list,
+                       output_path, offline=True)
+
+    return df
+
+
+def parse_arguments(argv=None):
+    """Parse the command line arguments.
+
+    Parameters:
+        argv (list): command line arguments, sys.argv by default
+
+    Returns:
+        arguments (argparse.Namespace): parsed arguments
+
+    Raises:
+        SystemExit: if the arguments are not valid
+    """
+    import argparse
+
+    def comma_list(value):
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    parser = argparse.ArgumentParser(
+        description='Scrape data about sovereign states from Wikipedia.')
+    parser.add_argument('--countries', type=comma_list,
+                        help='comma separated wikipedia page names, e.g. "France,Papua_New_Guinea"')
+    parser.add_argument('--attributes', type=comma_list,
+                        help='comma separated attributes, default: ' + ','.join(get_attributes_list()))
+    parser.add_argument('--only', type=comma_list, default=list(STATE_PARTS),
+                        help='comma separated parts to scrape: ' + ','.join(STATE_PARTS))
+    parser.add_argument('--plan', action='store_true',
+                        help='print the requests that would be made and exit')
+    parser.add_argument('--output',
+                        help='path to the csv file, default: data/export.csv for all states, '
+                             'data/subset/export.csv if --countries, --attributes or --only select a subset')
+    parser.add_argument('--errors', default='data/errors.csv',
+                        help='path to the csv file with the failures of a run')
+    parser.add_argument('--stream',
+                        help='path to a .csv or .jsonl file to append each state to as soon as it is finished')
+    parser.add_argument('--queue',
+                        help='path to a shared queue file to crawl with worker processes')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='number of local worker processes for --queue and --reprocess')
+    parser.add_argument('--worker', action='store_true',
+                        help='only work on the states of an existing --queue')
+    parser.add_argument('--snapshots',
+                        help='directory of a snapshot archive to record every fetched page to')
+    parser.add_argument('--replay',
+                        help='directory of a snapshot archive to read all pages from, without network access')
+    parser.add_argument('--replay-at', type=float,
+                        help='unix time, replay the snapshots fetched at or before it')
+    parser.add_argument('--reprocess',
+                        help='directory of a snapshot archive to re-run the extraction over with --processes')
+    parser.add_argument('--serve', type=int, nargs='?', const=8780,
+                        help='run as a service with a json api on this port of localhost (default 8780)')
+    parser.add_argument('--socket',
+                        help='run as a service with a json api on this unix socket')
+    parser.add_argument('--cache-seconds', type=float, default=600,
+                        help='seconds the service serves fetched pages from memory')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='run fetch, parse, extract and clean as separate stages')
+    parser.add_argument('--workers', type=comma_list, default=[],
+                        help='workers per stage for --pipeline, e.g. "fetch=8,parse=2"')
+    arguments = parser.parse_args(argv)
+
+    unknown_parts = set(arguments.only) - set(STATE_PARTS)
+    if unknown_parts:
+        parser.error('unknown parts for --only: ' +
+                     ','.join(sorted(unknown_parts)))
+
+    try:
+        arguments.workers = {stage: int(count) for stage, count in
+                             (item.split('=') for item in arguments.workers)}
+    except ValueError:
+        parser.error('--workers expects stage=count pairs')
+
+    if arguments.worker and not arguments.queue:
+        parser.error('--worker requires --queue')
+
+    # a subset never replaces the full export and its deck
+    if arguments.output is None:
+        subset = arguments.countries or arguments.attributes or set(arguments.only) != set(STATE_PARTS)
+        arguments.output = 'data/subset/export.csv' if subset else 'data/export.csv'
+
+    return arguments
+
+
+def scrape_states(states, attributes_list, parts=STATE_PARTS, on_state=None, backoff_seconds=2.0):
+    """Scrape states one after another and retry their transient failures at the end.
+
+    Parameters:
+        states (list): dicts with name, link and sovereignityDispute from get_selected_states()
+        attributes_list (list): attributes to search for
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+        on_state (function): called with the data of each state as soon as it is finished
+        backoff_seconds (float): wait before the first round of retries
+
+    Returns:
+        states_dict (dict): name of a state as key and its data as value
+        errors (list): failures of the states, see get_failure()
+
+    Raises:
+        None
+    """
+    # init dict to collect dicts of individual states and their failures
+    states_dict = {}
+    errors = []
+
+    # iterate over selected states, a failed part never stops the run
+    for state in states:
+
+        # collect data about an individual state
+        state_errors = []
+        state_dict = get_state_data(state['link'], attributes_list, {
+            'name': state['name'], 'sovereignityDispute': state['sovereignityDispute']},
+            parts, state_errors)
+        errors.extend(state_errors)
+
+        # add state dict to a dict of all states, failed states are passed on after the retries
+        states_dict[state['name']] = state_dict
+        if on_state is not None and not state_errors:
+            on_state(state_dict)
+
+    # retry transient failures at the end
+    if errors:
+        retry_failures(states_dict, errors, attributes_list,
+                       parts, backoff_seconds=backoff_seconds)
+        if on_state is not None:
+            for name in dict.fromkeys(failure['name'] for failure in errors):
+                on_state(states_dict[name])
+
+    return states_dict, errors
+
+
+def run_states(arguments, attributes_list, parts, snapshots=None, on_state=None):
+    """Scrape the selected states in the mode chosen on the command line.
+
+    Parameters:
+        arguments (argparse.Namespace): parsed arguments, see parse_arguments()
+        attributes_list (list): attributes to search for
+        parts (tuple): parts to scrape, any of "attributes", "flag" and "map"
+        snapshots (tuple): directory, mode and time of the snapshot archive in use
+        on_state (function): called with the data of each state as soon as it is finished
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: no table or match found when searching
+    """
+    # re-run the extraction over stored snapshots
+    if arguments.reprocess:
+        reprocess_states(arguments.reprocess, arguments.processes, arguments.countries,
+                         attributes_list, parts, arguments.output, arguments.replay_at, on_state,
+                         arguments.errors)
+        return
+
+    # work on a shared queue
+    if arguments.worker:
+        run_state_worker(arguments.queue)
+        return
+    if arguments.queue:
+        main_distributed(arguments.queue, arguments.processes, arguments.countries,
+                         attributes_list, parts, arguments.output, snapshots, on_state,
+                         arguments.errors)
+        return
+
+    # run the stages of all states with separate worker pools
+    if arguments.pipeline:
+        states_dict, errors = run_states_pipeline(get_selected_states(arguments.countries),
+                                                  attributes_list, parts, arguments.workers,
+                                                  on_state=on_state)
+        if errors:
+            retry_failures(states_dict, errors, attributes_list, parts)
+            if on_state is not None:
+                for name in dict.fromkeys(failure['name'] for failure in errors):
+                    on_state(states_dict[name])
+    else:
+        states_dict, errors = scrape_states(get_selected_states(arguments.countries),
+                                            attributes_list, parts, on_state)
+
+    # record all failures
+    if errors:
+        export_errors(errors, arguments.errors)
+
+    # clean and export data of all states
+    df = export_states(states_dict, attributes_list, arguments.output, offline=bool(arguments.replay))
 
     print(df.head())
-    print(df.iloc[10])
-    print[df['links'].iloc[10][0]]
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    attributes_list = arguments.attributes or get_attributes_list()
+    parts = tuple(arguments.only)
+
+    # record fetched pages or replay them without network access
+    snapshots = None
+    if arguments.replay:
+        snapshots = (arguments.replay, 'replay', arguments.replay_at)
+    elif arguments.snapshots:
+        snapshots = (arguments.snapshots, 'record', None)
+    if snapshots:
+        wf.use_snapshots(*snapshots)
+
+    # print the planned requests without running anything
+    if arguments.plan:
+        archive, _, _ = wf.get_snapshot_archive()
+        planned_requests = plan_requests(arguments.countries, parts, archive)
+        for url, purpose, source in planned_requests:
+            print('GET ' + url + '  (' + purpose + ', ' + source + ')')
+        network_requests = [request for request in planned_requests
+                            if request[2] == 'network']
+        if arguments.countries:
+            print(str(len(network_requests)) + ' of ' +
+                  str(len(planned_requests)) + ' requests go to the network')
+        else:
+            print(str(len(planned_requests) - 1) + ' requests per state planned')
+        return
+
+    # keep everything warm and take refresh jobs until interrupted
+    if arguments.serve or arguments.socket:
+        import services.refresh_server as rs
+        rs.serve(arguments.serve, arguments.socket, arguments.cache_seconds)
+        return
+
+    # append finished states to a file while the run goes on
+    stream_writer = None
+    on_state = None
+    if arguments.stream:
+        stream_writer = sw.StreamWriter(
+            arguments.stream, get_state_columns(attributes_list, parts))
+        on_state = stream_writer.write
+    try:
+        run_states(arguments, attributes_list, parts, snapshots, on_state)
+    finally:
+        if stream_writer is not None:
+            print(str(stream_writer.close()) +
+                  ' states streamed to ' + arguments.stream)
 
 
 if __name__ == '__main__':
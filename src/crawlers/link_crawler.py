@@ -0,0 +1,494 @@
+import collections
+import concurrent.futures
+import hashlib
+import math
+import os
+import re
+import tempfile
+import urllib.parse
+
+import crawlers.work_queue as wq
+import scrapers.static_website_scraper as sws
+
+
+class BloomFilter:
+    """Set of strings in a fixed bit array that may report false positives.
+
+    Each item sets hash_count bits, derived from one blake2b digest by double hashing.
+    The bit array is sized for the expected number of items and the false positive rate.
+
+    Parameters:
+        capacity (int): expected number of items
+        error_rate (float): false positive rate at capacity
+    """
+
+    def __init__(self, capacity=10000000, error_rate=0.001):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError('capacity must be positive and error_rate between 0 and 1')
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def get_positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+
+        return [(first + index * second) % self.size for index in range(self.hash_count)]
+
+    def add(self, item):
+        """Add an item.
+
+        Parameters:
+            item (str): item to add
+
+        Returns:
+            added (bool): False if the item was probably added before
+
+        Raises:
+            None
+        """
+        added = False
+        for position in self.get_positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        self.count += added
+
+        return added
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self.get_positions(item))
+
+    def __len__(self):
+        return self.count
+
+
+class VisitedSet:
+    """Set of visited urls that stays small for millions of urls.
+
+    Urls are kept in an exact set until exact_limit is reached, then they are moved
+    into a bloom filter. Small crawls are exact, large crawls may skip a url now and
+    then at the false positive rate of the filter.
+
+    Parameters:
+        exact_limit (int): number of urls kept exactly
+        capacity (int): expected number of urls of the bloom filter
+        error_rate (float): false positive rate of the bloom filter at capacity
+    """
+
+    def __init__(self, exact_limit=100000, capacity=10000000, error_rate=0.001):
+        self.exact_limit = exact_limit
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.urls = set()
+        self.bloom_filter = None
+
+    def add(self, url):
+        """Add a url.
+
+        Parameters:
+            url (str): normalized url
+
+        Returns:
+            added (bool): False if the url was (probably) visited before
+
+        Raises:
+            None
+        """
+        if self.bloom_filter is not None:
+            return self.bloom_filter.add(url)
+        if url in self.urls:
+            return False
+        self.urls.add(url)
+
+        # switch to the bloom filter once the exact set gets large
+        if len(self.urls) > self.exact_limit:
+            self.bloom_filter = BloomFilter(max(self.capacity, 2 * len(self.urls)), self.error_rate)
+            for exact_url in self.urls:
+                self.bloom_filter.add(exact_url)
+            self.urls = set()
+
+        return True
+
+    def __contains__(self, url):
+        if self.bloom_filter is not None:
+            return url in self.bloom_filter
+        return url in self.urls
+
+    def __len__(self):
+        return len(self.bloom_filter) if self.bloom_filter is not None else len(self.urls)
+
+
+class Frontier:
+    """First in, first out queue of urls and their depth that spills to disk.
+
+    Up to max_memory urls are kept in memory, further urls are appended to a work
+    queue file and read back in batches once the urls in memory are used up, so that
+    the order of the urls is kept.
+
+    Parameters:
+        max_memory (int): number of urls kept in memory
+        spill_path (str): path to the sqlite file of the spilled urls, a temporary
+            file that is removed on close() by default
+        batch_size (int): number of urls written or read at once
+    """
+
+    def __init__(self, max_memory=100000, spill_path=None, batch_size=1000):
+        self.max_memory = max_memory
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.urls = collections.deque()
+        self.buffer = []
+        self.spilled = 0
+        self.connection = None
+        self.temporary = False
+
+    def append(self, url, depth):
+        """Queue a url.
+
+        Parameters:
+            url (str): normalized url
+            depth (int): number of links from a start url
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        # once urls are spilled, all further urls follow them to keep the order
+        if not self.spilled and len(self.urls) < self.max_memory:
+            self.urls.append((url, depth))
+            return
+        self.buffer.append((url, depth))
+        self.spilled += 1
+        if len(self.buffer) >= self.batch_size:
+            self.write_buffer()
+
+    def write_buffer(self):
+        if not self.buffer:
+            return
+        if self.connection is None:
+            if self.spill_path is None:
+                file_descriptor, self.spill_path = tempfile.mkstemp(suffix='.sqlite')
+                os.close(file_descriptor)
+                self.temporary = True
+            self.connection = wq.open_queue(self.spill_path)
+        # urls of an earlier crawl in the same file are skipped by the queue
+        added = wq.enqueue(self.connection, [url for url, _ in self.buffer],
+                           [{'depth': depth} for _, depth in self.buffer])
+        self.spilled -= len(self.buffer) - added
+        self.buffer = []
+
+    def popleft(self):
+        """Take the oldest url.
+
+        Parameters:
+            None
+
+        Returns:
+            url (str): normalized url
+            depth (int): number of links from a start url
+
+        Raises:
+            IndexError: if the frontier is empty
+        """
+        if not self.urls and self.spilled:
+            self.write_buffer()
+            items = wq.claim(self.connection, 'frontier', batch_size=self.batch_size)
+            for item_id, url, payload in items:
+                wq.complete(self.connection, item_id, 'frontier', {})
+                self.urls.append((url, payload['depth']))
+            self.spilled = self.spilled - len(items) if items else 0
+
+        return self.urls.popleft()
+
+    def close(self):
+        """Close and remove a temporary spill file.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.temporary:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.spill_path + suffix):
+                    os.remove(self.spill_path + suffix)
+
+    def __len__(self):
+        return len(self.urls) + self.spilled
+
+
+def normalize_url(url):
+    """Normalize a url so that equal pages get equal urls.
+
+    Scheme and host are lowercased, default ports, fragments and repeated slashes
+    are dropped and an empty path becomes "/".
+
+    Parameters:
+        url (str): absolute url
+
+    Returns:
+        url (str): normalized url, None if it is not a http or https url
+
+    Raises:
+        None
+    """
+    try:
+        parts = urllib.parse.urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ('http', 'https') or not parts.hostname:
+        return None
+
+    netloc = parts.hostname.lower()
+    if port is not None and port != {'http': 80, 'https': 443}[scheme]:
+        netloc += ':' + str(port)
+    path = re.sub('/{2,}', '/', parts.path) or '/'
+
+    return urllib.parse.urlunsplit((scheme, netloc, path, parts.query, ''))
+
+
+def is_allowed_domain(url, domains):
+    """Check whether the host of a url is one of the domains or a subdomain of one.
+
+    Parameters:
+        url (str): normalized url
+        domains (list): allowed domains, e.g. ['en.wikipedia.org'], None to allow all
+
+    Returns:
+        allowed (bool): True if the url may be crawled
+
+    Raises:
+        None
+    """
+    if domains is None:
+        return True
+    host = urllib.parse.urlsplit(url).hostname
+
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+def extract_title(url, soup, depth):
+    """Default extractor of crawl(), the title of each page.
+
+    Parameters:
+        url (str): url of the page
+        soup (bs4.BeautifulSoup): parsed page
+        depth (int): number of links from a start url
+
+    Returns:
+        record (dict): url, depth and title of the page
+
+    Raises:
+        None
+    """
+    heading = soup.find('h1') or soup.find('title')
+
+    return {'url': url, 'depth': depth, 'title': heading.get_text(' ', strip=True) if heading else None}
+
+
+def crawl(start_urls, extractor=extract_title, max_depth=1, max_pages=100, domains=None,
+          max_pages_per_domain=None, url_pattern=None, link_attributes={}, threads=4,
+          visited=None, on_page=None, max_frontier=100000, spill_path=None):
+    """Crawl pages breadth first from start urls and extract data from each page.
+
+    Pages are loaded level by level, the pages of a level in parallel threads. The
+    links of each page are found like in scrape_links() and queued for the next level
+    if they pass the limits and were not visited before. Pages that can't be loaded
+    or that the extractor fails on are recorded as errors and the crawl goes on.
+
+    Parameters:
+        start_urls (list): urls of depth 0
+        extractor (function): called with url, soup and depth of each page, returns a
+            record or None to skip the page
+        max_depth (int): maximum number of links from a start url
+        max_pages (int): maximum number of loaded pages
+        domains (list): allowed domains and their subdomains, None to allow all
+        max_pages_per_domain (int): maximum number of loaded pages of each host
+        url_pattern (str): regular expression that the followed urls must match,
+            e.g. r'/wiki/[^:]+$' for articles only
+        link_attributes (dict): specification to get particular links
+        threads (int): number of pages loaded at the same time
+        visited (VisitedSet): urls to skip, shared between crawls, a new set by default
+        on_page (function): called with each record as soon as it is extracted
+        max_frontier (int): number of queued urls kept in memory, see Frontier
+        spill_path (str): path to the sqlite file of further queued urls, temporary by default
+
+    Returns:
+        records (list): records of the extractor
+        errors (list): dicts with url, depth, stage ("load" or "extract") and error of
+            pages that failed
+
+    Raises:
+        ValueError: if max_depth or max_pages is negative
+    """
+    import requests
+
+    if max_depth < 0 or max_pages < 0:
+        raise ValueError('max_depth and max_pages must not be negative')
+    if visited is None:
+        visited = VisitedSet()
+    url_pattern = re.compile(url_pattern) if url_pattern else None
+
+    # queue the start urls regardless of the pattern
+    frontier = Frontier(max_frontier, spill_path)
+    for url in start_urls:
+        url = normalize_url(url)
+        if url is not None and is_allowed_domain(url, domains) and visited.add(url):
+            frontier.append(url, 0)
+
+    def load_page(url, depth):
+        try:
+            soup = sws.get_soup(url)
+            links = sws.extract_links(soup, url, link_attributes, absolute_paths=True,
+                                      as_frame=False, columns=['href']) if depth < max_depth else []
+        except (ValueError, requests.RequestException) as error:
+            return None, [], {'url': url, 'depth': depth, 'stage': 'load', 'error': repr(error)}
+        hrefs = [link['href'] for link in links]
+
+        # a failing extractor loses the record, the links are still followed
+        try:
+            return extractor(url, soup, depth), hrefs, None
+        except Exception as error:
+            return None, hrefs, {'url': url, 'depth': depth, 'stage': 'extract', 'error': repr(error)}
+
+    records = []
+    errors = []
+    domain_counts = collections.Counter()
+    pages = 0
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            while frontier and pages < max_pages:
+
+                # take the next batch of the frontier within the page limits
+                batch = []
+                while frontier and pages + len(batch) < max_pages and len(batch) < threads * 4:
+                    url, depth = frontier.popleft()
+                    host = urllib.parse.urlsplit(url).netloc
+                    if max_pages_per_domain is not None and domain_counts[host] >= max_pages_per_domain:
+                        continue
+                    domain_counts[host] += 1
+                    batch.append((url, depth))
+                pages += len(batch)
+
+                futures = [executor.submit(load_page, url, depth) for url, depth in batch]
+                for (url, depth), future in zip(batch, futures):
+                    record, hrefs, error = future.result()
+                    if error is not None:
+                        errors.append(error)
+                    if record is not None:
+                        records.append(record)
+                        if on_page is not None:
+                            on_page(record)
+
+                    # queue the unseen links of the page for the next level
+                    for href in hrefs:
+                        href = normalize_url(href)
+                        if href is None or not is_allowed_domain(href, domains):
+                            continue
+                        if url_pattern is not None and not url_pattern.search(href):
+                            continue
+                        if visited.add(href):
+                            frontier.append(href, depth + 1)
+
+        left = len(frontier)
+    finally:
+        frontier.close()
+
+    print('finished: crawl of ' + str(pages) + ' pages, ' + str(len(errors)) + ' failed, ' +
+          str(left) + ' queued urls left')
+
+    return records, errors
+
+
+def test_visited_set():
+    # testcase: exact set switches to the bloom filter without losing urls
+    visited = VisitedSet(exact_limit=100, capacity=10000, error_rate=0.001)
+    urls = ['https://en.wikipedia.org/wiki/Page_' + str(index) for index in range(5000)]
+    added = [visited.add(url) for url in urls]
+    assert all(added[:101]), 'expected all urls to be new before the switch'
+    assert visited.bloom_filter is not None, 'expected bloom filter after exact_limit'
+    assert all(url in visited for url in urls), 'expected no false negatives'
+    assert not visited.add(urls[0]), 'expected known url to be rejected'
+    false_positives = sum('https://en.wikipedia.org/wiki/Other_' + str(index) in visited
+                          for index in range(10000))
+    assert false_positives < 50, 'expected few false positives, got ' + str(false_positives)
+
+    # testcase: normalization of equal urls
+    assert normalize_url('HTTPS://En.Wikipedia.org:443//wiki/France#History') == \
+        'https://en.wikipedia.org/wiki/France', 'expected normalized url'
+    assert normalize_url('mailto:info@example.org') is None, 'expected None for other schemes'
+
+
+def test_crawl():
+    import threading
+
+    import benchmarks.mock_wiki as mw
+
+    server, base_url = mw.create_mock_wiki(states=30, page_kb=1, extra_rows=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def extract_state(url, soup, depth):
+        if url.endswith('/State_3'):
+            raise KeyError('no capital')
+        return extract_title(url, soup, depth)
+
+    # testcase: failing pages and extractors are recorded and the frontier spills to disk
+    try:
+        records, errors = crawl([base_url + 'wiki/List_of_sovereign_states', base_url + 'wiki/Missing'],
+                                extract_state, max_depth=1, max_pages=50,
+                                url_pattern=r'/wiki/State_\d+$', max_frontier=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+    titles = [record['title'] for record in records]
+    assert len(records) == 30, 'expected list page and 29 states, got ' + str(len(records))
+    assert titles[1:4] == ['State 0', 'State 1', 'State 2'], 'expected breadth first order'
+    assert sorted((error['stage'], error['url'][len(base_url):]) for error in errors) == \
+        [('extract', 'wiki/State_3'), ('load', 'wiki/Missing')], 'expected two failed pages'
+
+
+def main(argv=None):
+    import argparse
+
+    import exporters.stream_writer as sw
+
+    parser = argparse.ArgumentParser(
+        description='Crawl linked pages breadth first and write the title of each page.')
+    parser.add_argument('start_urls', nargs='+')
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--max-pages', type=int, default=100)
+    parser.add_argument('--domains', help='comma separated allowed domains, the start domains by default')
+    parser.add_argument('--pattern', help='regular expression that followed urls must match')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--output', default='data/crawl.csv', help='path to a csv or .jsonl file')
+    arguments = parser.parse_args(argv)
+
+    domains = arguments.domains.split(',') if arguments.domains else \
+        [urllib.parse.urlsplit(url).hostname for url in arguments.start_urls]
+    stream_writer = sw.StreamWriter(arguments.output, ['url', 'depth', 'title'])
+    try:
+        crawl(arguments.start_urls, max_depth=arguments.depth, max_pages=arguments.max_pages,
+              domains=domains, url_pattern=arguments.pattern, threads=arguments.threads,
+              on_page=stream_writer.write)
+    finally:
+        print('finished: ' + str(stream_writer.close()) + ' pages written to ' + arguments.output)
+
+
+if __name__ == '__main__':
+    main()
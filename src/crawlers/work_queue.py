@@ -0,0 +1,286 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id integer primary key,
+    url text not null unique,
+    payload text not null,
+    status text not null default 'pending',
+    lease_owner text,
+    lease_expires real,
+    attempts integer not null default 0,
+    result text,
+    error text);
+CREATE INDEX IF NOT EXISTS ix_items_status on items (status, lease_expires);
+"""
+
+
+def open_queue(queue_path):
+    """Open a work queue that several processes or nodes can share.
+
+    Parameters:
+        queue_path (str): path to the sqlite file of the queue
+
+    Returns:
+        connection (sqlite3.Connection): connection to the queue
+
+    Raises:
+        None
+    """
+    directory = os.path.dirname(queue_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # autocommit mode, transactions are started explicitly
+    connection = sqlite3.connect(
+        queue_path, timeout=60, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(QUEUE_SCHEMA)
+
+    return connection
+
+
+def enqueue(connection, urls, payloads=None, requeue=False):
+    """Add urls to the queue, urls that are already queued are skipped.
+
+    Parameters:
+        connection (sqlite3.Connection): connection to the queue
+        urls (list): urls to process, e.g. the links of get_states_list()
+        payloads (list): json serializable data for each url
+        requeue (bool): put urls that are already queued back to pending with the new
+            payload, their results and attempts of earlier runs are dropped
+
+    Returns:
+        count (int): number of added or requeued urls
+
+    Raises:
+        None
+    """
+    if payloads is None:
+        payloads = [{}] * len(urls)
+
+    connection.execute('BEGIN IMMEDIATE')
+    count = connection.total_changes
+    if requeue:
+        statement = ("INSERT INTO items (url, payload) VALUES (?, ?) ON CONFLICT (url) DO UPDATE SET "
+                     "payload = excluded.payload, status = 'pending', lease_owner = NULL, "
+                     "lease_expires = NULL, attempts = 0, result = NULL, error = NULL")
+    else:
+        statement = 'INSERT OR IGNORE INTO items (url, payload) VALUES (?, ?)'
+    connection.executemany(statement, [(url, json.dumps(payload))
+                                       for url, payload in zip(urls, payloads)])
+    count = connection.total_changes - count
+    connection.execute('COMMIT')
+
+    return count
+
+
+def claim(connection, worker_id, lease_seconds=300, batch_size=1, max_attempts=3):
+    """Lease pending items to a worker, expired leases are put back first.
+
+    Parameters:
+        connection (sqlite3.Connection): connection to the queue
+        worker_id (str): name of the worker
+        lease_seconds (float): time until an unfinished item is handed out again
+        batch_size (int): number of items to lease
+        max_attempts (int): leases per item before it is marked as failed
+
+    Returns:
+        items (list): tuples of id, url and payload of the leased items
+
+    Raises:
+        None
+    """
+    now = time.time()
+
+    # lock the queue so that no item is leased twice
+    connection.execute('BEGIN IMMEDIATE')
+    connection.execute("UPDATE items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "error = CASE WHEN attempts >= ? THEN 'lease expired' ELSE error END "
+                       "WHERE status = 'leased' AND lease_expires < ?",
+                       (max_attempts, max_attempts, now))
+    rows = connection.execute("SELECT id, url, payload FROM items WHERE status = 'pending' "
+                              "ORDER BY id LIMIT ?", (batch_size,)).fetchall()
+    connection.executemany("UPDATE items SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                           "attempts = attempts + 1 WHERE id = ?",
+                           [(worker_id, now + lease_seconds, row[0]) for row in rows])
+    connection.execute('COMMIT')
+
+    items = [(item_id, url, json.loads(payload))
+             for item_id, url, payload in rows]
+
+    return items
+
+
+def complete(connection, item_id, worker_id, result):
+    """Write the result of an item back, unless the lease went to another worker.
+
+    Parameters:
+        connection (sqlite3.Connection): connection to the queue
+        item_id (int): id of the item
+        worker_id (str): name of the worker
+        result (dict): json serializable result
+
+    Returns:
+        completed (bool): False if the lease was lost
+
+    Raises:
+        None
+    """
+    cursor = connection.execute("UPDATE items SET status = 'done', result = ?, error = NULL "
+                                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                                (json.dumps(result), item_id, worker_id))
+    return cursor.rowcount == 1
+
+
+def fail(connection, item_id, worker_id, error, max_attempts=3):
+    """Record an error of an item and put it back into the queue while attempts are left.
+
+    Parameters:
+        connection (sqlite3.Connection): connection to the queue
+        item_id (int): id of the item
+        worker_id (str): name of the worker
+        error (str): reason of the failure
+        max_attempts (int): leases per item before it is marked as failed
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    connection.execute("UPDATE items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "error = ?, lease_owner = NULL, lease_expires = NULL "
+                       "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                       (max_attempts, error, item_id, worker_id))
+
+
+def get_progress(connection):
+    """Count the items of the queue by status.
+
+    Parameters:
+        connection (sqlite3.Connection): connection to the queue
+
+    Returns:
+        progress (dict): status as key and number of items as value
+
+    Raises:
+        None
+    """
+    return dict(connection.execute('SELECT status, COUNT(*) FROM items GROUP BY status'))
+
+
+def get_results(connection, urls=None):
+    """Get the results of all finished items.
+
+    Parameters:
+        connection (sqlite3.Connection): connection to the queue
+        urls (list): only get the results of these urls, e.g. the urls of the current run
+
+    Returns:
+        results (list): result dicts in the order the urls were queued
+
+    Raises:
+        None
+    """
+    urls = set(urls) if urls is not None else None
+    rows = connection.execute(
+        "SELECT url, result FROM items WHERE status = 'done' ORDER BY id")
+    return [json.loads(result) for url, result in rows if urls is None or url in urls]
+
+
+def get_new_results(connection, seen_ids, urls=None):
+    """Get the results of items that finished since the last call.
+
+    Only the ids of the finished items are read to find the new ones, the results
+    of items that were seen before aren't loaded again.
+
+    Parameters:
+        connection (sqlite3.Connection): connection to the queue
+        seen_ids (set): ids of the items returned before, updated in place
+        urls (set): only get the results of these urls, all by default
+
+    Returns:
+        results (list): result dicts of the new items in the order the urls were queued
+
+    Raises:
+        None
+    """
+    new_ids = [item_id for item_id, url in connection.execute(
+               "SELECT id, url FROM items WHERE status = 'done' ORDER BY id")
+               if item_id not in seen_ids and (urls is None or url in urls)]
+
+    # read the new results in chunks below the sqlite limit of variables
+    results = []
+    for start in range(0, len(new_ids), 500):
+        chunk = new_ids[start:start + 500]
+        rows = connection.execute('SELECT result FROM items WHERE id IN (' + ','.join('?' * len(chunk)) +
+                                  ') ORDER BY id', chunk)
+        results += [json.loads(row[0]) for row in rows]
+    seen_ids.update(new_ids)
+
+    return results
+
+
+def run_worker(queue_path, process_item, worker_id=None, lease_seconds=300,
+               max_attempts=3, idle_timeout=None):
+    """Claim items from the queue and process them until the queue is drained.
+
+    Parameters:
+        queue_path (str): path to the sqlite file of the queue
+        process_item (callable): function of url and payload that returns a result dict
+        worker_id (str): name of the worker, host and process id by default
+        lease_seconds (float): time until an unfinished item is handed out again
+        max_attempts (int): leases per item before it is marked as failed
+        idle_timeout (float): seconds to wait for leases of other workers to expire,
+            lease_seconds by default so that the items of crashed workers are taken over
+
+    Returns:
+        processed (int): number of items completed by this worker
+
+    Raises:
+        None
+    """
+    if worker_id is None:
+        worker_id = socket.gethostname() + ':' + str(os.getpid())
+    if idle_timeout is None:
+        idle_timeout = lease_seconds
+
+    connection = open_queue(queue_path)
+    processed = 0
+    idle_since = None
+    try:
+        while True:
+            items = claim(connection, worker_id,
+                          lease_seconds, max_attempts=max_attempts)
+
+            # stop when nothing is left, or wait for leases of other workers
+            if not items:
+                if get_progress(connection).get('leased', 0) == 0:
+                    break
+                idle_since = idle_since or time.time()
+                if time.time() - idle_since > idle_timeout:
+                    break
+                time.sleep(1)
+                continue
+            idle_since = None
+
+            # process the item and write the result back
+            item_id, url, payload = items[0]
+            try:
+                result = process_item(url, payload)
+            except Exception as error:
+                print("failed: " + url + " (" + repr(error) + ")")
+                fail(connection, item_id, worker_id,
+                     repr(error), max_attempts)
+                continue
+            if complete(connection, item_id, worker_id, result):
+                processed += 1
+    finally:
+        connection.close()
+
+    return processed
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zipfile
+
+# ids of the note type and the deck, fixed so that re-imports update the same deck
+MODEL_ID = 1607392319001
+DECK_ID = 1607392319002
+
+COLLECTION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS col (
+    id integer primary key, crt integer not null, mod integer not null,
+    scm integer not null, ver integer not null, dty integer not null,
+    usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null,
+    tags text not null);
+CREATE TABLE IF NOT EXISTS notes (
+    id integer primary key, guid text not null, mid integer not null,
+    mod integer not null, usn integer not null, tags text not null,
+    flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null);
+CREATE TABLE IF NOT EXISTS cards (
+    id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null,
+    type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null);
+CREATE TABLE IF NOT EXISTS revlog (
+    id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null,
+    factor integer not null, time integer not null, type integer not null);
+CREATE TABLE IF NOT EXISTS graves (
+    usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX IF NOT EXISTS ix_notes_usn on notes (usn);
+CREATE INDEX IF NOT EXISTS ix_cards_usn on cards (usn);
+CREATE INDEX IF NOT EXISTS ix_revlog_usn on revlog (usn);
+CREATE INDEX IF NOT EXISTS ix_cards_nid on cards (nid);
+CREATE INDEX IF NOT EXISTS ix_cards_sched on cards (did, queue, due);
+CREATE INDEX IF NOT EXISTS ix_revlog_cid on revlog (cid);
+CREATE INDEX IF NOT EXISTS ix_notes_csum on notes (csum);
+"""
+
+
+def get_note_id(country, field):
+    """Derive a stable note id from a country and a field.
+
+    Parameters:
+        country (str): name of the country
+        field (str): name of the field
+
+    Returns:
+        note_id (int): positive 63 bit integer
+
+    Raises:
+        None
+    """
+    digest = hashlib.sha1((country + '\x1f' + field).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') >> 1
+
+
+def get_checksum(text):
+    """Compute the checksum Anki uses to find duplicates of the sort field.
+
+    Parameters:
+        text (str): sort field of a note
+
+    Returns:
+        checksum (int): first 32 bits of the sha1 hash
+
+    Raises:
+        None
+    """
+    return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def get_collection_settings(timestamp):
+    """Set up the note type, deck and configuration of the collection.
+
+    Parameters:
+        timestamp (int): creation time in seconds
+
+    Returns:
+        settings (tuple): json strings for conf, models, decks and dconf
+
+    Raises:
+        None
+    """
+    model = {'id': MODEL_ID, 'name': 'Geography', 'type': 0, 'mod': timestamp,
+             'usn': -1, 'sortf': 0, 'did': DECK_ID, 'tags': [], 'vers': [],
+             'req': [[0, 'any', [0, 1]]],
+             'css': '.card { font-family: arial; font-size: 20px; text-align: center; }',
+             'latexPre': '', 'latexPost': '',
+             'flds': [{'name': name, 'ord': index, 'sticky': False, 'rtl': False,
+                       'font': 'Arial', 'size': 20, 'media': []}
+                      for index, name in enumerate(['Country', 'Feature', 'Value'])],
+             'tmpls': [{'name': 'Card 1', 'ord': 0, 'did': None, 'bqfmt': '', 'bafmt': '',
+                        'qfmt': '{{Feature}} of {{Country}}?',
+                        'afmt': '{{FrontSide}}<hr id=answer>{{Value}}'}]}
+    deck_config = {'id': 1, 'name': 'Default', 'mod': 0, 'usn': 0, 'maxTaken': 60,
+                   'autoplay': True, 'timer': 0, 'replayq': True, 'dyn': False,
+                   'new': {'delays': [1, 10], 'ints': [1, 4, 7], 'initialFactor': 2500,
+                           'order': 1, 'perDay': 20, 'bury': True, 'separate': True},
+                   'rev': {'perDay': 200, 'ease4': 1.3, 'fuzz': 0.05, 'ivlFct': 1,
+                           'maxIvl': 36500, 'bury': True, 'minSpace': 1},
+                   'lapse': {'delays': [10], 'mult': 0, 'minInt': 1,
+                             'leechFails': 8, 'leechAction': 0}}
+    decks = {str(deck_id): {'id': deck_id, 'name': name, 'mod': timestamp, 'usn': -1,
+                            'desc': '', 'dyn': 0, 'conf': 1, 'collapsed': False,
+                            'extendNew': 10, 'extendRev': 50,
+                            'newToday': [0, 0], 'revToday': [0, 0],
+                            'lrnToday': [0, 0], 'timeToday': [0, 0]}
+             for deck_id, name in [(1, 'Default'), (DECK_ID, 'Geography')]}
+    conf = {'nextPos': 1, 'curDeck': DECK_ID, 'curModel': MODEL_ID,
+            'activeDecks': [DECK_ID], 'sortType': 'noteFld', 'sortBackwards': False}
+
+    return (json.dumps(conf), json.dumps({str(MODEL_ID): model}),
+            json.dumps(decks), json.dumps({'1': deck_config}))
+
+
+def open_collection(collection_path):
+    """Open an Anki collection and create its tables if it is new.
+
+    Parameters:
+        collection_path (str): path to the collection file
+
+    Returns:
+        connection (sqlite3.Connection): connection to the collection
+
+    Raises:
+        None
+    """
+    directory = os.path.dirname(collection_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    connection = sqlite3.connect(collection_path)
+    connection.executescript(COLLECTION_SCHEMA)
+
+    # add the collection row with note type and deck once
+    if connection.execute('SELECT COUNT(*) FROM col').fetchone()[0] == 0:
+        timestamp = int(time.time())
+        conf, models, decks, dconf = get_collection_settings(timestamp)
+        connection.execute('INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, ?)',
+                           (timestamp, timestamp * 1000, timestamp * 1000,
+                            conf, models, decks, dconf, '{}'))
+        connection.commit()
+
+    return connection
+
+
+def get_notes(df, fields, media_fields={}, country_column='name'):
+    """Turn a dataframe of states into notes with one note per country and field.
+
+    Parameters:
+        df (pd.DataFrame): states as rows and fields as columns
+        fields (list): names of the columns with text values
+        media_fields (dict): field name as key and column with a stored media path as value
+        country_column (str): name of the column with the country name
+
+    Returns:
+        notes (dict): note id as key and the list of note fields as value
+
+    Raises:
+        None
+    """
+    notes = {}
+    for _, row in df.iterrows():
+        country = str(row[country_column])
+
+        # text fields are used as they are
+        for field in fields:
+            if field in row and isinstance(row[field], str) and row[field] != '':
+                notes[get_note_id(country, field)] = [country, field, row[field]]
+
+        # media fields reference the content addressed file names
+        for field, column in media_fields.items():
+            if column in row and isinstance(row[column], str):
+                notes[get_note_id(country, field)] = [
+                    country, field, '<img src="' + os.path.basename(row[column]) + '">']
+
+    return notes
+
+
+def write_notes(connection, notes):
+    """Insert new notes and update changed notes in one transaction.
+
+    Parameters:
+        connection (sqlite3.Connection): connection to the collection
+        notes (dict): note id as key and the list of note fields as value
+
+    Returns:
+        counts (dict): number of added, updated and unchanged notes
+
+    Raises:
+        None
+    """
+    timestamp = int(time.time())
+
+    # compare with the stored notes in one query
+    stored_notes = dict(connection.execute('SELECT id, flds FROM notes'))
+    next_position = connection.execute(
+        'SELECT COALESCE(MAX(due), 0) + 1 FROM cards WHERE type = 0').fetchone()[0]
+
+    added_notes, added_cards, updated_notes = [], [], []
+    for note_id, note_fields in notes.items():
+        flds = '\x1f'.join(note_fields)
+        checksum = get_checksum(note_fields[0])
+        if note_id not in stored_notes:
+            added_notes.append((note_id, format(note_id, 'x'), MODEL_ID, timestamp, -1,
+                                '', flds, note_fields[0], checksum, 0, ''))
+            added_cards.append((note_id, note_id, DECK_ID, 0, timestamp, -1,
+                                0, 0, next_position, 0, 0, 0, 0, 0, 0, 0, 0, ''))
+            next_position += 1
+        elif stored_notes[note_id] != flds:
+            updated_notes.append(
+                (flds, note_fields[0], checksum, timestamp, note_id))
+
+    # write all changes as batches in a single transaction
+    with connection:
+        connection.executemany(
+            'INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', added_notes)
+        connection.executemany(
+            'INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', added_cards)
+        connection.executemany(
+            'UPDATE notes SET flds = ?, sfld = ?, csum = ?, mod = ?, usn = -1 WHERE id = ?', updated_notes)
+        connection.execute('UPDATE col SET mod = ?', (timestamp * 1000,))
+
+    counts = {'added': len(added_notes),
+              'updated': len(updated_notes),
+              'unchanged': len(notes) - len(added_notes) - len(updated_notes)}
+
+    return counts
+
+
+def write_package(collection_path, package_path, media_directory, media_files):
+    """Bundle the collection and its media files into an .apkg file.
+
+    Parameters:
+        collection_path (str): path to the collection file
+        package_path (str): path to the package file
+        media_directory (str): directory of the stored media files
+        media_files (list): file names of the media used by the notes
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    media_map = {}
+    with zipfile.ZipFile(package_path + '.tmp', 'w', zipfile.ZIP_DEFLATED) as package:
+        package.write(collection_path, 'collection.anki2')
+
+        # media files are stored by number and mapped to their hash names
+        for index, media_file in enumerate(sorted(media_files)):
+            media_path = os.path.join(media_directory, media_file)
+            if os.path.exists(media_path):
+                package.write(media_path, str(index), zipfile.ZIP_STORED)
+                media_map[str(index)] = media_file
+        package.writestr('media', json.dumps(media_map))
+
+    os.replace(package_path + '.tmp', package_path)
+
+
+def export_deck(df, fields, media_fields={}, collection_path='data/deck.anki2',
+                package_path='data/deck.apkg', media_directory='data/media'):
+    """Write the states directly into an Anki collection and package.
+
+    Parameters:
+        df (pd.DataFrame): states as rows and fields as columns
+        fields (list): names of the columns with text values
+        media_fields (dict): field name as key and column with a stored media path as value
+        collection_path (str): path to the collection file that is kept between runs
+        package_path (str): path to the package file for the import into Anki
+        media_directory (str): directory of the stored media files
+
+    Returns:
+        counts (dict): number of added, updated and unchanged notes
+
+    Raises:
+        None
+    """
+    # write status to console
+    print("started: export_deck() to " + package_path)
+
+    # write notes into the collection
+    notes = get_notes(df, fields, media_fields)
+    connection = open_collection(collection_path)
+    try:
+        counts = write_notes(connection, notes)
+    finally:
+        connection.close()
+
+    # bundle collection and media
+    media_files = set()
+    for column in media_fields.values():
+        if column in df:
+            media_files.update(os.path.basename(path)
+                               for path in df[column] if isinstance(path, str))
+    write_package(collection_path, package_path, media_directory, media_files)
+
+    return counts
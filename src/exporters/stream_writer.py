@@ -0,0 +1,119 @@
+import csv
+import json
+import os
+import threading
+import time
+
+
+class StreamWriter:
+    """Append rows to a csv or json lines file while a crawl is still running.
+
+    Rows are buffered and written in batches, each batch is flushed to disk so that
+    other jobs can read the finished rows right away. A timer writes rows that wait
+    longer than flush_seconds, also when no further row arrives. The format is chosen by the file
+    extension, ".jsonl" for json lines and csv for everything else.
+
+    Parameters:
+        path (str): path to the output file
+        columns (list): keys of the rows in the order of the columns
+        batch_size (int): number of rows that are written together
+        flush_seconds (float): maximum time a finished row waits in the buffer
+        separator (str): column separator of csv files
+        append (bool): add to the rows of an existing file instead of starting a new one
+    """
+
+    def __init__(self, path, columns, batch_size=10, flush_seconds=5.0, separator=';', append=False):
+        self.path = path
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.json_lines = path.endswith('.jsonl')
+        self.rows = []
+        self.count = 0
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.timer = None
+
+        # each run starts with an empty file unless the rows should accumulate
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self.csv_writer = csv.writer(self.file, delimiter=separator)
+
+    def write(self, row):
+        """Add a finished row and write the batch when it is full or old enough.
+
+        Parameters:
+            row (dict): values of the row, missing columns are left empty
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.lock:
+            self.rows.append(row)
+            if len(self.rows) >= self.batch_size or \
+                    time.monotonic() - self.flushed_at >= self.flush_seconds:
+                self.write_rows()
+
+            # write the first row of a new batch in time, even if it stays the only one
+            elif self.timer is None:
+                self.timer = threading.Timer(self.flush_seconds, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def write_rows(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        # write the buffered rows in the order of the columns
+        for row in self.rows:
+            if self.json_lines:
+                self.file.write(json.dumps({column: row.get(column) for column in self.columns},
+                                           ensure_ascii=False, default=str) + '\n')
+            else:
+                self.csv_writer.writerow(['' if row.get(column) is None else row.get(column)
+                                          for column in self.columns])
+        self.count += len(self.rows)
+        self.rows = []
+        self.file.flush()
+        self.flushed_at = time.monotonic()
+
+    def flush(self):
+        """Write all buffered rows.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.lock:
+            if not self.file.closed:
+                self.write_rows()
+
+    def close(self):
+        """Write all buffered rows and close the file.
+
+        Parameters:
+            None
+
+        Returns:
+            count (int): number of rows written
+
+        Raises:
+            None
+        """
+        with self.lock:
+            if not self.file.closed:
+                self.write_rows()
+                self.file.close()
+
+        return self.count
@@ -0,0 +1,213 @@
+import functools
+import os
+import re
+
+# feature list maintained next to the archived scraper
+FEATURE_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', '..', 'archive', 'feature_list.csv')
+
+
+class FeatureMatcher:
+    """Match infobox rows against the compiled entries of a feature list.
+
+    Each entry follows the naming convention "Category/Alternative_Feature/Alternative",
+    e.g. "Capital/capital_Largest/largest". Without "_" the category alternatives are
+    also used for the feature. All alternatives are compiled once, and the alternatives
+    found in a row label are cached, so labels that repeat across countries are only
+    searched once.
+
+    Parameters:
+        features (list): entries of the feature list
+        flags (int): flags of the compiled alternatives, e.g. re.IGNORECASE
+    """
+
+    def __init__(self, features, flags=0):
+        self.features = list(features)
+        self.patterns = []
+        self.category_patterns = []
+        self.features_by_pattern = {}
+        self.label_cache = {}
+
+        # split the entries and compile every distinct alternative once
+        pattern_ids = {}
+        for feature_idx, feature in enumerate(self.features):
+            levels = [level.split('/') for level in feature.split('_')]
+            category_alternatives = levels[0]
+            feature_alternatives = levels[1] if len(levels) > 1 else levels[0]
+            for alternatives, is_category in [(category_alternatives, True),
+                                              (feature_alternatives, False)]:
+                ids = set()
+                for alternative in alternatives:
+                    if alternative not in pattern_ids:
+                        pattern_ids[alternative] = len(self.patterns)
+                        self.patterns.append(re.compile(alternative, flags))
+                    ids.add(pattern_ids[alternative])
+                if is_category:
+                    self.category_patterns.append(frozenset(ids))
+                else:
+                    for pattern_id in ids:
+                        self.features_by_pattern.setdefault(
+                            pattern_id, []).append(feature_idx)
+
+    def match_label(self, label):
+        """Find the alternatives contained in a row label.
+
+        Parameters:
+            label (str): category or feature of an infobox row
+
+        Returns:
+            pattern_ids (frozenset): ids of the matching alternatives
+
+        Raises:
+            None
+        """
+        pattern_ids = self.label_cache.get(label)
+        if pattern_ids is None:
+            pattern_ids = frozenset(pattern_id for pattern_id, pattern in enumerate(self.patterns)
+                                    if pattern.search(label))
+            self.label_cache[label] = pattern_ids
+        return pattern_ids
+
+    def find_rows(self, categories, labels):
+        """Find all rows of each entry of the feature list in one pass.
+
+        Parameters:
+            categories (list): category of each row
+            labels (list): feature label of each row
+
+        Returns:
+            rows (list): positions of the matching rows for each entry of the feature list
+
+        Raises:
+            None
+        """
+        rows = [[] for _ in self.features]
+        for position, (category, label) in enumerate(zip(categories, labels)):
+            category_ids = self.match_label(str(category))
+            matched = set()
+            for pattern_id in self.match_label(str(label)):
+                for feature_idx in self.features_by_pattern.get(pattern_id, []):
+                    if feature_idx not in matched and category_ids & self.category_patterns[feature_idx]:
+                        matched.add(feature_idx)
+                        rows[feature_idx].append(position)
+
+        return rows
+
+    def classify(self, data):
+        """Assign the entries of the feature list to the rows of an infobox in one pass.
+
+        Parameters:
+            data (pd.DataFrame): infobox rows with the columns category and feature
+
+        Returns:
+            matches (dict): entry of the feature list as key and the first matching
+                row label of data as value
+
+        Raises:
+            None
+        """
+        rows = self.find_rows(data['category'].tolist(), data['feature'].tolist())
+        matches = {feature: data.index[positions[0]]
+                   for feature, positions in zip(self.features, rows) if positions}
+
+        return matches
+
+    def filter_data(self, data):
+        """Filter data for the features of the feature list.
+
+        Parameters:
+            data (pd.DataFrame): infobox rows with the columns category, feature and value
+
+        Returns:
+            filtered_data (pd.DataFrame): columns feature and value in the order of the feature list
+
+        Raises:
+            None
+        """
+        import pandas as pd
+
+        matches = self.classify(data)
+        filtered_data = pd.DataFrame({'feature': list(matches.keys()),
+                                      'value': data.loc[list(matches.values()), 'value'].tolist()},
+                                     columns=['feature', 'value'])
+
+        return filtered_data
+
+
+@functools.lru_cache(maxsize=None)
+def load_feature_matcher(path=FEATURE_LIST_PATH):
+    """Read a feature list once and compile it into a matcher.
+
+    Parameters:
+        path (str): path to the feature list csv
+
+    Returns:
+        matcher (FeatureMatcher): compiled matcher, shared by all callers
+
+    Raises:
+        None
+    """
+    with open(path, encoding='utf-8') as feature_file:
+        features = [line.strip() for line in feature_file if line.strip()]
+
+    return FeatureMatcher(features)
+
+
+@functools.lru_cache(maxsize=64)
+def load_attribute_matcher(attributes):
+    """Compile the attributes of country_data_scraping into a matcher.
+
+    A nested attribute like "area_total" matches rows labelled "total" in a category
+    "area", any other attribute matches rows by their label in any category. Case is
+    ignored, like in the row selection of match_state_attributes().
+
+    Parameters:
+        attributes (tuple): attributes to search for
+
+    Returns:
+        matcher (FeatureMatcher): compiled matcher with one entry per attribute
+
+    Raises:
+        None
+    """
+    return FeatureMatcher([attribute if '_' in attribute else '.*_' + attribute
+                           for attribute in attributes], flags=re.IGNORECASE)
+
+
+def test_feature_matcher():
+    import pandas as pd
+
+    matcher = FeatureMatcher(['Capital/capital_Largest/largest',
+                              'Area_Total/Excluding/Land/proper',
+                              'Religion'])
+    data = pd.DataFrame({'category': ['Capital and largest city', 'Area', 'Area', 'Religion'],
+                         'feature': ['Capital and largest city', 'Area', 'Total', 'Religion'],
+                         'value': ['Paris', '', '643,801 km2', '51.1% Christianity']})
+
+    # testcase: nested feature with alternatives
+    filtered_data = matcher.filter_data(data)
+    assert_data = '643,801 km2'
+    test_data = filtered_data.loc[1, 'value']
+    assert test_data == assert_data, "Test expected '" + \
+        assert_data + "' but got '" + test_data + "'"
+
+    # testcase: feature without nested level, order of the feature list
+    assert_data = 'Religion'
+    test_data = filtered_data.loc[2, 'feature']
+    assert test_data == assert_data, "Test expected '" + \
+        assert_data + "' but got '" + test_data + "'"
+
+    # testcase: attributes match case insensitive, top level attributes in any category
+    matcher = load_attribute_matcher(('capital', 'area_total', 'religion'))
+    rows = matcher.find_rows(data['category'].tolist(), data['feature'].tolist())
+    assert rows == [[0], [2], [3]], "Test expected [[0], [2], [3]] but got " + str(rows)
+
+    print("FeatureMatcher was tested successfully.")
+
+
+def main():
+    test_feature_matcher()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import collections
+import threading
+import time
+
+
+class StageQueue:
+    """Bounded queue between two pipeline stages.
+
+    Items from earlier stages block while the queue is full, which holds fast stages
+    back. Items sent back from later stages, like follow-up fetches, never block and
+    are handed out first, so a loop between stages can't deadlock.
+
+    Parameters:
+        maxsize (int): number of items from earlier stages the queue holds
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = collections.deque()
+        self.follow_ups = collections.deque()
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, item, follow_up=False):
+        """Add an item, waiting for free space unless it is a follow-up.
+
+        Parameters:
+            item (object): item to add
+            follow_up (bool): item was sent back from a later stage
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.condition:
+            if follow_up:
+                self.follow_ups.append(item)
+            else:
+                while len(self.items) >= self.maxsize and not self.closed:
+                    self.condition.wait()
+                self.items.append(item)
+            self.condition.notify_all()
+
+    def get(self):
+        """Take the next item, waiting until one arrives or the queue is closed.
+
+        Parameters:
+            None
+
+        Returns:
+            (found, item) (tuple): found is False once the queue is closed and empty
+
+        Raises:
+            None
+        """
+        with self.condition:
+            while not self.follow_ups and not self.items and not self.closed:
+                self.condition.wait()
+            if self.follow_ups:
+                item = self.follow_ups.popleft()
+            elif self.items:
+                item = self.items.popleft()
+            else:
+                return False, None
+            self.condition.notify_all()
+            return True, item
+
+    def close(self):
+        """Wake up all waiting workers so that they can stop.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+def run_pipeline(source, stages, queue_size=16):
+    """Run items through stages that each have their own worker pool.
+
+    Every stage function takes an item and returns a list of (stage, item) tuples to
+    pass on, where stage is the name of any stage or None for a finished result.
+
+    Parameters:
+        source (iterable): (stage, item) tuples to start with
+        stages (list): (name, function, workers) tuples in the order of the pipeline
+        queue_size (int): number of items each queue holds before earlier stages wait
+
+    Returns:
+        results (list): finished results in the order they were completed
+        errors (list): dicts with stage, item and error of items that raised an exception
+        statistics (dict): stage name as key and processed items and busy seconds as value
+
+    Raises:
+        None
+    """
+    stage_order = {name: index for index,
+                   (name, _, _) in enumerate(stages)}
+    queues = {name: StageQueue(queue_size) for name, _, _ in stages}
+    statistics = {name: {'items': 0, 'busy_seconds': 0.0}
+                  for name, _, _ in stages}
+    results = []
+    errors = []
+    lock = threading.Lock()
+
+    # items that were queued but not processed yet, the pipeline stops at zero
+    outstanding = [0]
+    source_done = threading.Event()
+
+    def finish_item():
+        with lock:
+            outstanding[0] -= 1
+            finished = outstanding[0] == 0 and source_done.is_set()
+        if finished:
+            for stage_queue in queues.values():
+                stage_queue.close()
+
+    def dispatch(target, item, from_stage=None):
+        if target is None:
+            with lock:
+                results.append(item)
+            return
+        with lock:
+            outstanding[0] += 1
+        follow_up = from_stage is not None and stage_order[target] <= stage_order[from_stage]
+        queues[target].put(item, follow_up)
+
+    def work(name, function):
+        while True:
+            found, item = queues[name].get()
+            if not found:
+                return
+            start = time.perf_counter()
+            try:
+                outputs = function(item)
+            except Exception as error:
+                outputs = []
+                with lock:
+                    errors.append(
+                        {'stage': name, 'item': item, 'error': error})
+            with lock:
+                statistics[name]['items'] += 1
+                statistics[name]['busy_seconds'] += time.perf_counter() - start
+            for target, output in outputs:
+                dispatch(target, output, name)
+            finish_item()
+
+    # start the worker pools of all stages
+    threads = []
+    for name, function, workers in stages:
+        for _ in range(workers):
+            thread = threading.Thread(
+                target=work, args=(name, function), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    # feed the source, blocking while the first queue is full
+    with lock:
+        outstanding[0] += 1
+    for target, item in source:
+        dispatch(target, item)
+    source_done.set()
+    finish_item()
+
+    for thread in threads:
+        thread.join()
+
+    return results, errors, statistics
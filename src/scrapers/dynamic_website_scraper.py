@@ -0,0 +1,228 @@
+import json
+import re
+import urllib.parse
+
+import scrapers.website_fetcher as wf
+
+# pandas and bs4 are imported on first use to keep imports fast
+
+# quoted urls in inline scripts that look like json data endpoints
+JSON_URL_PATTERN = re.compile(
+    r'["\'](?P<url>(?:https?:)?/?/?[^"\'\s<>]*?'
+    r'(?:\.json(?:\?[^"\'\s<>]*)?|/api(?:\.php)?[/?][^"\'\s<>]*|[?&]format=json[^"\'\s<>]*))["\']')
+
+# attributes that declare data endpoints on elements
+ENDPOINT_ATTRIBUTES = ['data-url', 'data-src', 'data-endpoint', 'data-source']
+
+# script types that hold inline json data
+JSON_SCRIPT_TYPES = ['application/json', 'application/ld+json']
+
+
+def find_json_endpoints(url, page=None):
+    """Find the json data endpoints a dynamic website loads its data from.
+
+    Endpoints are read from data attributes of elements and from quoted urls
+    in inline scripts.
+
+    Parameters:
+        url (str): url of a website
+        page (str): html of the website, fetched from url if not given
+
+    Returns:
+        endpoints (list): absolute urls of the endpoints in the order they were found
+
+    Raises:
+        ValueError: if url is not valid
+    """
+    from bs4 import BeautifulSoup
+
+    if page is None:
+        page = wf.get_page(url).text
+    soup = BeautifulSoup(page, 'html5lib')
+    endpoints = []
+
+    # endpoints declared on elements
+    for attribute in ENDPOINT_ATTRIBUTES:
+        for tag in soup.find_all(attrs={attribute: True}):
+            endpoints.append(tag[attribute])
+
+    # endpoints referenced in inline scripts
+    for script in soup.find_all('script', src=False):
+        if script.get('type') in JSON_SCRIPT_TYPES:
+            continue
+        endpoints.extend(match.group('url')
+                         for match in JSON_URL_PATTERN.finditer(script.string or ''))
+
+    # resolve relative urls and drop duplicates
+    endpoints = list(dict.fromkeys(urllib.parse.urljoin(url, endpoint.replace('\\/', '/'))
+                                   for endpoint in endpoints))
+
+    return endpoints
+
+
+def scrape_inline_json(url, page=None):
+    """Scrape json data embedded in script tags of a website.
+
+    Parameters:
+        url (str): url of a website
+        page (str): html of the website, fetched from url if not given
+
+    Returns:
+        json_container (list): parsed json objects
+
+    Raises:
+        ValueError: if url is not valid
+    """
+    from bs4 import BeautifulSoup
+
+    if page is None:
+        page = wf.get_page(url).text
+    soup = BeautifulSoup(page, 'html5lib')
+
+    # parse each data script and skip the invalid ones
+    json_container = []
+    for script in soup.find_all('script', type=JSON_SCRIPT_TYPES):
+        try:
+            json_container.append(json.loads(script.string or ''))
+        except ValueError:
+            continue
+
+    return json_container
+
+
+def get_records(data, record_path=None):
+    """Select the list of records from a json object.
+
+    Parameters:
+        data (dict or list): parsed json object
+        record_path (str): keys to the records separated by dots, e.g. "query.pages"
+
+    Returns:
+        records (list): records, a single object is returned as one record
+
+    Raises:
+        ValueError: if record_path does not exist in data
+    """
+    # follow the given path
+    if record_path:
+        for key in record_path.split('.'):
+            if isinstance(data, list) and key.isdigit():
+                data = data[int(key)]
+            elif isinstance(data, dict) and key in data:
+                data = data[key]
+            else:
+                raise ValueError('record path not found: ' + record_path)
+
+    # records keyed by id are turned into a list
+    if isinstance(data, dict) and data and all(isinstance(value, dict) for value in data.values()):
+        data = list(data.values())
+
+    records = data if isinstance(data, list) else [data]
+
+    return records
+
+
+def scrape_json(url, endpoints=None, record_path=None, as_frame=True):
+    """Scrape the data of a dynamic website from its json endpoints instead of rendering it.
+
+    Parameters:
+        url (str): url of a website
+        endpoints (list): urls of the endpoints, relative to url, detected from the website if not given
+        record_path (str): keys to the records in each response separated by dots
+        as_frame (bool): return dataframes, otherwise lists of records without importing pandas
+
+    Returns:
+        data_container (list): one pd.DataFrame with the flattened records of each endpoint
+
+    Raises:
+        ValueError: if url or an endpoint is not valid
+    """
+    # set up a result container
+    data_container = []
+
+    # detect endpoints only if none are declared
+    if endpoints is None:
+        endpoints = find_json_endpoints(url)
+    else:
+        endpoints = [urllib.parse.urljoin(url, endpoint)
+                     for endpoint in endpoints]
+
+    # load each endpoint and select the records
+    for endpoint in endpoints:
+        try:
+            data = wf.get_page(endpoint).json()
+        except ValueError:
+            raise ValueError('endpoint is not valid: ' + endpoint)
+        records = get_records(data, record_path)
+
+        # flatten nested records into columns
+        if as_frame:
+            import pandas as pd
+            records = pd.json_normalize(records)
+        data_container.append(records)
+
+    return data_container
+
+
+def test_scrape_json():
+    import http.server
+    import threading
+
+    # local stand-in for a dynamic website and its json api
+    page = ('<html><body><div id="app" data-endpoint="/api/countries.json"></div>'
+            '<script>fetch("/api/capitals?format=json").then(render)</script>'
+            '<script type="application/json">{"country": "France"}</script>'
+            '</body></html>')
+    responses = {'/': ('text/html', page),
+                 '/api/countries.json': ('application/json',
+                                         '{"data": {"countries": [{"name": "France", "area": {"total": 643801}}]}}'),
+                 '/api/capitals?format=json': ('application/json', '[{"capital": "Paris"}]')}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            content_type, body = responses.get(
+                self.path, ('text/plain', 'not found'))
+            self.send_response(200 if self.path in responses else 404)
+            self.send_header('Content-Type', content_type)
+            self.end_headers()
+            self.wfile.write(body.encode('utf-8'))
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+
+    try:
+        # testcase: endpoints detected from attributes and scripts
+        endpoints = find_json_endpoints(url)
+        assert_data = url + 'api/capitals?format=json'
+        test_data = endpoints[1]
+        assert test_data == assert_data, "Test expected '" + \
+            assert_data + "' but got '" + test_data + "'"
+
+        # testcase: declared endpoint with record path and flattened columns
+        data = scrape_json(url, ['api/countries.json'], 'data.countries')
+        assert_data = 643801
+        test_data = data[0].loc[0, 'area.total']
+        assert test_data == assert_data, "Test expected '" + \
+            str(assert_data) + "' but got '" + str(test_data) + "'"
+
+        # testcase: inline json data
+        assert_data = 'France'
+        test_data = scrape_inline_json(url)[0]['country']
+        assert test_data == assert_data, "Test expected '" + \
+            assert_data + "' but got '" + test_data + "'"
+    finally:
+        server.shutdown()
+
+    print("scrape_json() was tested successfully.")
+
+
+def main():
+    test_scrape_json()
+
+
+if __name__ == '__main__':
+    main()
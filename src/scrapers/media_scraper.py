@@ -0,0 +1,228 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import tempfile
+import urllib.parse
+
+import scrapers.website_fetcher as wf
+
+
+def get_thumbnail_url(url, width):
+    """Turn the url of an original wikimedia file into the url of a rendered thumbnail.
+
+    Parameters:
+        url (str): url to an original file on upload.wikimedia.org
+        width (int): width of the thumbnail in pixels
+
+    Returns:
+        url (str): url to the thumbnail, or the original url if it can't be rewritten
+
+    Raises:
+        None
+    """
+    # add the scheme to protocol relative urls
+    url = urllib.parse.urljoin('https:', url)
+
+    # match ".../wikipedia/<project>/<a>/<ab>/<file>" and skip urls that are already thumbnails
+    match = re.match(
+        r'(https://upload\.wikimedia\.org/wikipedia/[^/]+)/(?!thumb/)([0-9a-f]/[0-9a-f]{2})/([^/]+)$', url)
+    if not match or width is None:
+        return url
+
+    # svg files are rendered as png thumbnails
+    base, path, file_name = match.groups()
+    thumbnail_name = str(width) + 'px-' + file_name
+    if file_name.lower().endswith('.svg'):
+        thumbnail_name += '.png'
+
+    return base + '/thumb/' + path + '/' + file_name + '/' + thumbnail_name
+
+
+def load_media_index(directory):
+    """Load the index of previously downloaded media files.
+
+    Parameters:
+        directory (str): directory of the media files
+
+    Returns:
+        index (dict): url as key and file information as value
+
+    Raises:
+        None
+    """
+    index_path = os.path.join(directory, 'index.json')
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, encoding='utf-8') as index_file:
+        return json.load(index_file)
+
+
+def save_media_index(directory, index):
+    """Save the index of downloaded media files.
+
+    Parameters:
+        directory (str): directory of the media files
+        index (dict): url as key and file information as value
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    index_path = os.path.join(directory, 'index.json')
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file, indent=1, sort_keys=True)
+    os.replace(index_path + '.tmp', index_path)
+
+
+def download_file(url, directory, entry=None):
+    """Download a single file and store it by the hash of its content.
+
+    Parameters:
+        url (str): url to the file
+        directory (str): directory to store the file in
+        entry (dict): index entry of a previous download of the url
+
+    Returns:
+        entry (dict): file information with hash, path, etag, last_modified and status
+
+    Raises:
+        ValueError: if url is not valid
+    """
+    # ask the server to skip the body if the file didn't change
+    headers = {}
+    if entry and os.path.exists(os.path.join(directory, entry['path'])):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response = wf.request(url, headers=headers)
+    if response.status_code == 304:
+        return dict(entry, status='unchanged')
+    if response.status_code != 200:
+        raise ValueError("url is not valid")
+
+    # store the content once per hash
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    extension = os.path.splitext(urllib.parse.urlparse(url).path)[1].lower()
+    path = content_hash + extension
+    if not os.path.exists(os.path.join(directory, path)):
+
+        # write to a temporary file of this download, equal files may be downloaded at once
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=directory, prefix=path + '.', suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as media_file:
+                media_file.write(response.content)
+            os.replace(temporary_path, os.path.join(directory, path))
+        except OSError:
+            # another download stored the same content first
+            if not os.path.exists(os.path.join(directory, path)):
+                raise
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    entry = {'hash': content_hash,
+             'path': path,
+             'etag': response.headers.get('ETag'),
+             'last_modified': response.headers.get('Last-Modified'),
+             'status': 'downloaded'}
+
+    return entry
+
+
+def download_media(urls, directory='data/media', width=None, max_workers=8):
+    """Download media files concurrently into a content addressed directory.
+
+    Parameters:
+        urls (list): urls to the files, e.g. the results of get_state_flag()
+        directory (str): directory to store the files in
+        width (int): request rendered thumbnails of this width instead of the originals
+        max_workers (int): number of parallel downloads
+
+    Returns:
+        media_container (pd.DataFrame): url, hash, path and status of each file
+
+    Raises:
+        None
+    """
+    import pandas as pd
+    import requests
+
+    # set up the directory and the index of previous runs
+    os.makedirs(directory, exist_ok=True)
+    index = load_media_index(directory)
+
+    # resolve the final url of each file once
+    download_urls = {url: get_thumbnail_url(url, width)
+                     for url in dict.fromkeys(urls) if isinstance(url, str)}
+
+    # download all files in parallel
+    media_container = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(download_file, download_url, directory, index.get(download_url)): url
+                   for url, download_url in download_urls.items()}
+        for future in concurrent.futures.as_completed(futures):
+            url = futures[future]
+            try:
+                entry = future.result()
+            except (ValueError, OSError, requests.RequestException) as error:
+                entry = {'hash': None, 'path': None,
+                         'status': 'failed: ' + str(error)}
+            if entry['hash'] is not None:
+                index[download_urls[url]] = {key: value for key, value in entry.items()
+                                             if key != 'status'}
+            media_container.append(dict(entry, url=url))
+
+    # save the index for the next run
+    save_media_index(directory, index)
+
+    # transform result container into dataframe
+    media_container = pd.DataFrame(
+        media_container, columns=['url', 'hash', 'path', 'status'])
+
+    return media_container
+
+
+def find_media(urls, directory='data/media', width=None):
+    """Look up previously downloaded media files without any request.
+
+    Parameters:
+        urls (list): urls to the files, e.g. the results of get_state_flag()
+        directory (str): directory of the stored files
+        width (int): width of the thumbnails the files were downloaded with
+
+    Returns:
+        media_container (pd.DataFrame): url, hash, path and status of each file, the status
+            is "missing" for files that were never downloaded
+
+    Raises:
+        None
+    """
+    import pandas as pd
+
+    index = load_media_index(directory)
+
+    # resolve each url like download_media() and read its index entry
+    media_container = []
+    for url in dict.fromkeys(urls):
+        if not isinstance(url, str):
+            continue
+        entry = index.get(get_thumbnail_url(url, width))
+        if entry is None or not os.path.exists(os.path.join(directory, entry['path'])):
+            media_container.append(
+                {'url': url, 'hash': None, 'path': None, 'status': 'missing'})
+        else:
+            media_container.append(
+                {'url': url, 'hash': entry['hash'], 'path': entry['path'], 'status': 'cached'})
+
+    # transform result container into dataframe
+    media_container = pd.DataFrame(
+        media_container, columns=['url', 'hash', 'path', 'status'])
+
+    return media_container
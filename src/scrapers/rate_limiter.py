@@ -0,0 +1,120 @@
+import threading
+import time
+import urllib.parse
+
+# status codes that ask the client to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class AdaptiveLimiter:
+    """Limit the number of requests in flight to one host and tune the limit AIMD style.
+
+    The limit grows by one per window of fast, successful responses and is halved
+    when the host throttles, times out or answers much slower than usual.
+
+    Parameters:
+        initial_limit (int): requests in flight at the start
+        min_limit (int): lower bound of the limit
+        max_limit (int): upper bound of the limit
+        slow_factor (float): latency relative to the baseline that counts as slow
+    """
+
+    def __init__(self, initial_limit=2, min_limit=1, max_limit=16, slow_factor=3.0):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.slow_factor = slow_factor
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.latency_baseline = None
+        self.latency_average = None
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Wait until a request may be sent.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.condition:
+            while True:
+                delay = self.blocked_until - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+
+    def release(self, latency, status_code=None, retry_after=None):
+        """Record the outcome of a request and adjust the limit.
+
+        Parameters:
+            latency (float): duration of the request in seconds
+            status_code (int): status code of the response, None if the request failed
+            retry_after (float): seconds the host asked to wait
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.condition:
+            self.in_flight -= 1
+
+            # follow latency with a slow baseline and a fast moving average
+            if self.latency_baseline is None:
+                self.latency_baseline = latency
+                self.latency_average = latency
+            else:
+                self.latency_baseline = min(
+                    latency, 0.95 * self.latency_baseline + 0.05 * latency)
+                self.latency_average = 0.7 * self.latency_average + 0.3 * latency
+
+            # back off multiplicatively on throttling and errors
+            if status_code is None or status_code in THROTTLE_STATUS_CODES:
+                self.limit = max(self.min_limit, self.limit / 2)
+                if retry_after:
+                    self.blocked_until = max(
+                        self.blocked_until, time.monotonic() + retry_after)
+            elif self.latency_average > self.slow_factor * self.latency_baseline:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.latency_average = self.latency_baseline
+
+            # ramp up additively while responses stay fast
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self.condition.notify_all()
+
+
+# one limiter per host, shared by all threads
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(url):
+    """Get the limiter of the host of an url.
+
+    Parameters:
+        url (str): url to a website
+
+    Returns:
+        limiter (AdaptiveLimiter): limiter shared by all requests to the host
+
+    Raises:
+        None
+    """
+    host = urllib.parse.urlparse(url).netloc.lower()
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = AdaptiveLimiter()
+        return _limiters[host]
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 text primary key,
+    pack text not null,
+    offset integer not null,
+    length integer not null,
+    size integer not null);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id integer primary key,
+    url text not null,
+    fetched_at real not null,
+    status_code integer not null,
+    headers text not null,
+    sha256 text not null);
+CREATE INDEX IF NOT EXISTS ix_snapshots_url on snapshots (url, fetched_at);
+"""
+
+
+class SnapshotArchive:
+    """Compressed, content addressed archive of fetched pages.
+
+    Page bodies are compressed and appended to pack files, identical bodies are stored
+    once. An sqlite index maps each url and fetch time to its body, and pack files are
+    memory-mapped for reading. Each process appends to its own pack file, so several
+    workers can record into the same archive.
+
+    Parameters:
+        directory (str): directory of the archive
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(directory, 'index.sqlite'),
+                                          timeout=60, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(ARCHIVE_SCHEMA)
+        self.lock = threading.Lock()
+        self.pack_name = None
+        self.pack_file = None
+        self.maps = {}
+
+    def store(self, url, content, status_code=200, headers=None, fetched_at=None):
+        """Store a fetched page.
+
+        Parameters:
+            url (str): url of the page
+            content (bytes): body of the response
+            status_code (int): status code of the response
+            headers (dict): headers of the response
+            fetched_at (float): unix time of the fetch, now by default
+
+        Returns:
+            sha256 (str): hash of the body
+
+        Raises:
+            None
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        with self.lock:
+
+            # append the body only if it isn't stored yet
+            known = self.connection.execute(
+                'SELECT 1 FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+            if not known:
+                if self.pack_file is None:
+                    self.pack_name = 'pack-' + str(os.getpid()) + '-' + \
+                        str(int(time.time() * 1000)) + '.dat'
+                    self.pack_file = open(os.path.join(
+                        self.directory, self.pack_name), 'ab')
+                compressed = zlib.compress(content, 6)
+                offset = self.pack_file.tell()
+                self.pack_file.write(compressed)
+                self.pack_file.flush()
+                self.connection.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?)',
+                                        (sha256, self.pack_name, offset, len(compressed), len(content)))
+
+            # index the snapshot by url and time
+            self.connection.execute('INSERT INTO snapshots (url, fetched_at, status_code, headers, sha256) '
+                                    'VALUES (?, ?, ?, ?, ?)',
+                                    (url, fetched_at or time.time(), status_code,
+                                     json.dumps(dict(headers or {})), sha256))
+            self.connection.commit()
+
+        return sha256
+
+    def read_blob(self, sha256):
+        """Read and decompress a stored body.
+
+        Parameters:
+            sha256 (str): hash of the body
+
+        Returns:
+            content (bytes): body, None if it is not stored
+
+        Raises:
+            None
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT pack, offset, length FROM blobs WHERE sha256 = ?',
+                                          (sha256,)).fetchone()
+            if row is None:
+                return None
+            pack, offset, length = row
+
+            # map each pack file once, remap when it has grown
+            pack_map = self.maps.get(pack)
+            if pack_map is None or len(pack_map) < offset + length:
+                if pack == self.pack_name:
+                    self.pack_file.flush()
+                with open(os.path.join(self.directory, pack), 'rb') as pack_file:
+                    pack_map = mmap.mmap(
+                        pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[pack] = pack_map
+
+        return zlib.decompress(pack_map[offset:offset + length])
+
+    def get(self, url, at=None):
+        """Get the latest snapshot of a page.
+
+        Parameters:
+            url (str): url of the page
+            at (float): unix time, the latest snapshot fetched at or before it is used
+
+        Returns:
+            snapshot (dict): content, status_code, headers and fetched_at, None if the url
+                has no snapshot
+
+        Raises:
+            None
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT fetched_at, status_code, headers, sha256 FROM snapshots '
+                                          'WHERE url = ? AND fetched_at <= ? ORDER BY fetched_at DESC LIMIT 1',
+                                          (url, at if at is not None else float('inf'))).fetchone()
+        if row is None:
+            return None
+
+        snapshot = {'content': self.read_blob(row[3]),
+                    'status_code': row[1],
+                    'headers': json.loads(row[2]),
+                    'fetched_at': row[0]}
+
+        return snapshot
+
+    def contains(self, url, at=None):
+        """Check if a page has a snapshot.
+
+        Parameters:
+            url (str): url of the page
+            at (float): unix time, only snapshots fetched at or before it count
+
+        Returns:
+            contained (bool): True if a snapshot exists
+
+        Raises:
+            None
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT 1 FROM snapshots WHERE url = ? AND fetched_at <= ?',
+                                          (url, at if at is not None else float('inf'))).fetchone()
+        return row is not None
+
+    def get_urls(self):
+        """List the urls that have snapshots.
+
+        Parameters:
+            None
+
+        Returns:
+            urls (list): distinct urls in the order they were first stored
+
+        Raises:
+            None
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT url FROM snapshots GROUP BY url ORDER BY MIN(id)').fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        """Close the index, the pack file and all memory maps.
+
+        Parameters:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.lock:
+            for pack_map in self.maps.values():
+                pack_map.close()
+            self.maps = {}
+            if self.pack_file is not None:
+                self.pack_file.close()
+                self.pack_file = None
+            self.connection.close()
@@ -1,12 +1,163 @@
+import collections
 import re
+import threading
 import urllib.parse
 
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
+import scrapers.table_extractor as te
+import scrapers.website_fetcher as wf
 
+# pandas, requests, bs4 and html5lib are imported on first use to keep imports fast
 
-def scrape_tables(url, table_attributes={}, display_none=False, append_links=False):
+# name, value pairs of the attributes in a start tag
+ATTRIBUTE_PATTERN = re.compile(
+    rb'''([^\s"'>/=]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''')
+
+# markup that can hide or fake tags from a byte scan
+AMBIGUOUS_MARKUP = [b'<!--', b'<script', b'<style', b'<textarea', b'<![cdata[']
+
+# parsed pages with the response they were parsed from, only kept while the cache is in use
+_soup_cache = {'max_soups': 0, 'soups': collections.OrderedDict()}
+_soup_cache_lock = threading.Lock()
+
+
+def parse_page(page):
+    """Parse the html of a page.
+
+    Parameters:
+        page (str): html of a website
+
+    Returns:
+        soup (bs4.BeautifulSoup): parsed page
+
+    Raises:
+        None
+    """
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(page, 'html5lib')
+
+
+def use_soup_cache(max_soups=32):
+    """Keep parsed pages in memory, so that a page is only parsed once per fetch.
+
+    The scrapers don't change the parsed pages, so several of them can share one.
+
+    Parameters:
+        max_soups (int): number of parsed pages kept, 0 to stop caching
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    with _soup_cache_lock:
+        _soup_cache['max_soups'] = max_soups
+        while len(_soup_cache['soups']) > max_soups:
+            _soup_cache['soups'].popitem(last=False)
+
+
+def get_soup(url):
+    """Load a page and parse it.
+
+    Parameters:
+        url (str): url to a website
+
+    Returns:
+        soup (bs4.BeautifulSoup): parsed page
+
+    Raises:
+        ValueError: if url is not valid
+    """
+    response = wf.get_page(url)
+
+    # reuse the parsed page as long as the same response is served
+    with _soup_cache_lock:
+        cached = _soup_cache['soups'].get(url)
+        if cached is not None and cached[0] is response:
+            _soup_cache['soups'].move_to_end(url)
+            return cached[1]
+
+    soup = parse_page(response.text)
+
+    with _soup_cache_lock:
+        if _soup_cache['max_soups'] > 0:
+            _soup_cache['soups'][url] = (response, soup)
+            _soup_cache['soups'].move_to_end(url)
+            while len(_soup_cache['soups']) > _soup_cache['max_soups']:
+                _soup_cache['soups'].popitem(last=False)
+
+    return soup
+
+
+def slice_element(content, tag_name, attributes):
+    """Find the bytes of the only element that matches a tag name and attributes.
+
+    The raw page is scanned for start tags of the element and its end is found by
+    balancing start and end tags. Only class and id attributes are compared, like
+    BeautifulSoup does it.
+
+    Parameters:
+        content (bytes): raw html of a page
+        tag_name (str): name of the tag, e.g. "table"
+        attributes (dict): class and id of the element
+
+    Returns:
+        fragment (bytes): html of the element, None if it isn't found exactly once
+            or if the scan can't be sure about it
+
+    Raises:
+        None
+    """
+    if not attributes or set(attributes) - {'class', 'id'} or \
+            not all(isinstance(value, str) for value in attributes.values()):
+        return None
+    tag_pattern = re.compile(
+        rb'<(/?)' + re.escape(tag_name.encode('ascii')) + rb'(?=[\s/>])([^>]*)>', re.IGNORECASE)
+
+    # find the start tags with matching attributes
+    starts = []
+    for match in tag_pattern.finditer(content):
+        if match.group(1):
+            continue
+        tag_attributes = {}
+        for attribute in ATTRIBUTE_PATTERN.finditer(match.group(2)):
+            name = attribute.group(1).lower().decode('ascii', 'replace')
+            value = next(group for group in attribute.groups()[1:] if group is not None)
+            tag_attributes.setdefault(name, value.decode('utf-8', 'replace'))
+        if all(name in tag_attributes and (tag_attributes[name] == value or
+                                           name == 'class' and (value in tag_attributes[name].split() or
+                                                                ' '.join(tag_attributes[name].split()) == value))
+               for name, value in attributes.items()):
+            starts.append(match.start())
+    if len(starts) != 1:
+        return None
+    start = starts[0]
+
+    # a start tag inside a comment isn't an element
+    if content.rfind(b'<!--', 0, start) > content.rfind(b'-->', 0, start):
+        return None
+
+    # balance start and end tags of nested elements
+    depth = 0
+    for match in tag_pattern.finditer(content, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            fragment = content[start:match.end()]
+            break
+    else:
+        return None
+
+    # comments and scripts could hold tags that the scan counted
+    lowered = fragment.lower()
+    if any(markup in lowered for markup in AMBIGUOUS_MARKUP):
+        return None
+
+    return fragment
+
+
+def scrape_tables(url, table_attributes={}, display_none=False, append_links=False,
+                  append_categories=False, as_frame=True, pre_slice=False):
     """Scrape tables from a static website.
 
     Parameters:
@@ -14,107 +165,251 @@ def scrape_tables(url, table_attributes={}, display_none=False, append_links=Fal
         table_attributes (dict): specification to get particular tables
         display_none (bool): get data that is hidden on the website
         append_links (bool): get links from each row and append them in an extra column
+        append_categories (bool): get the section header of each row and add it as column "category"
+        as_frame (bool): return dataframes, otherwise plain lists of rows without importing pandas
+        pre_slice (bool): only parse the bytes of the table if table_attributes match a
+            single table, the whole page is parsed otherwise
 
     Returns:
-        table_container (list): list of pd.DataFrame object containing the table data
+        table_container (list): list of pd.DataFrame object containing the table data,
+            or list of dicts with the keys rows and categories if as_frame is False
 
     Raises:
         ValueError: if url is not valid
     """
+    # load page and get soup, cut out the table first if that is unambiguous
+    if pre_slice:
+        response = wf.get_page(url)
+        fragment = slice_element(response.content, 'table', table_attributes)
+        if fragment is not None:
+            soup = parse_page(fragment.decode(
+                response.encoding or 'utf-8', 'replace'))
+        else:
+            soup = parse_page(response.text)
+    else:
+        soup = get_soup(url)
+
+    return extract_tables(soup, table_attributes, display_none, append_links,
+                          append_categories, as_frame)
+
+
+def extract_tables(soup, table_attributes={}, display_none=False, append_links=False,
+                   append_categories=False, as_frame=True):
+    """Extract tables from a parsed page, see scrape_tables().
 
-    # set up a result container
-    table_container = []
+    Parameters:
+        soup (bs4.BeautifulSoup): parsed page
+        table_attributes (dict): specification to get particular tables
+        display_none (bool): get data that is hidden on the website
+        append_links (bool): get links from each row and append them in an extra column
+        append_categories (bool): get the section header of each row and add it as column "category"
+        as_frame (bool): return dataframes, otherwise plain lists of rows without importing pandas
 
-    # check response code when of the url
-    if requests.get(url).status_code != 200:
-        raise ValueError("url is not valid")
+    Returns:
+        table_container (list): list of pd.DataFrame object containing the table data,
+            or list of dicts with the keys rows and categories if as_frame is False
 
-    # load page and get soup
-    page = requests.get(url).text
-    soup = BeautifulSoup(page, 'html5lib')
+    Raises:
+        None
+    """
+    # set up a result container
+    table_container = []
 
-    # find and iterate over tables
+    # find tables and extract each of them in a single walk
     tables = soup.find_all('table', attrs=table_attributes)
     for table in tables:
-        data_container = []
-
-        # find and iterate over table rows
-        table_rows = table.find_all('tr')
-        for table_row in table_rows:
-
-            # delete invisible cells before parsing the text
-            if not display_none:
-                table_cells_none = table_row.find_all(
-                    "span", style=re.compile("none"))
-                for table_cell_none in table_cells_none:
-                    table_cell_none.decompose()
-
-            # find header/body cells and parse their text
-            table_cells = table_row.find_all(["td", "th"])
-            table_row_parsed = [table_cell.text.strip()
-                                for table_cell in table_cells]
-
-            # find and parse all links in the row
-            if append_links:
-                table_row_hrefs = table_row.find_all('a', href=True)
-                table_row_parsed.append([table_row_href.get(
-                    'href') for table_row_href in table_row_hrefs])
+        grid, categories = te.extract_table(
+            table, display_none, append_links, append_categories)
 
-            # append parsed table row to data container
-            data_container.append(table_row_parsed)
+        # return plain lists on the fast path
+        if not as_frame:
+            table_container.append({'rows': grid, 'categories': categories})
+            continue
 
         # convert nested list to dataframe and append to container
-        table_container.append(pd.DataFrame(data_container))
+        import pandas as pd
+        data = pd.DataFrame(grid)
+        if append_categories:
+            data['category'] = categories
+        table_container.append(data)
 
     return table_container
 
 
-def scrape_images(url, image_attributes={}):
+def scrape_images(url, image_attributes={}, as_frame=True, candidates=False, width=None, density=None):
     """Scrape images from a static website.
 
     Parameters:
         url (str): url to a website
         image_attributes (dict): specification to get particular images
+        as_frame (bool): return a dataframe, otherwise a list of dicts without importing pandas
+        candidates (bool): add the column candidates with the files of each image, see get_image_candidates()
+        width (int): add the column selected with the smallest file at least this wide
+        density (float): add the column selected with the smallest file for this pixel density
 
     Returns:
         image_container (pd.DataFrame): dataframe containing the image data
 
+    Raises:
+        ValueError: if url is not valid
+    """
+    # load page and get soup
+    soup = get_soup(url)
+
+    return extract_images(soup, image_attributes, as_frame, url, candidates, width, density)
+
+
+def get_image_candidates(image, url=None):
+    """List the files an image can be loaded from, based on src, srcset and data-file-width.
+
+    Parameters:
+        image (dict): attributes of an img tag
+        url (str): url of the page to resolve relative sources
+
+    Returns:
+        candidates (list): dicts with url, width and density of each file, ordered by
+            width, width is None if the img tag has no width to compute it from
+
     Raises:
         None
+    """
+    try:
+        base_width = int(image.get('width'))
+    except (TypeError, ValueError):
+        base_width = None
+
+    # src is shown at the width of the tag
+    sources = []
+    if image.get('src'):
+        sources.append((image['src'], base_width, 1.0))
+
+    # srcset entries are "<url> <density>x" or "<url> <width>w"
+    for entry in image.get('srcset', '').split(','):
+        fields = entry.split()
+        if not fields:
+            continue
+        descriptor = fields[1] if len(fields) > 1 else '1x'
+        try:
+            value = float(descriptor[:-1])
+        except ValueError:
+            continue
+        if descriptor.endswith('x'):
+            sources.append((fields[0], round(value * base_width)
+                            if base_width else None, value))
+        elif descriptor.endswith('w'):
+            sources.append((fields[0], int(value),
+                            value / base_width if base_width else None))
+
+    # wikimedia thumbnails of a file with a known width also lead to the original
+    match = re.match(r'(.*)/thumb/([0-9a-f]/[0-9a-f]{2}/[^/]+)/[^/]+$', image.get('src', ''))
+    if match and image.get('data-file-width', '').isdigit():
+        file_width = int(image['data-file-width'])
+        sources.append((match.group(1) + '/' + match.group(2), file_width,
+                        file_width / base_width if base_width else None))
+
+    # resolve relative sources and drop duplicates
+    candidates = {}
+    for source, source_width, source_density in sources:
+        if url is not None:
+            source = urllib.parse.urljoin(url, source)
+        candidates.setdefault(source, {'url': source, 'width': source_width,
+                                       'density': source_density})
+    candidates = sorted(candidates.values(), key=lambda candidate: (
+        candidate['width'] is None, candidate['width'] or 0, candidate['density'] or 0))
+
+    return candidates
+
+
+def select_image(candidates, width=None, density=None):
+    """Select the smallest file of an image that meets a requested width or density.
+
+    Parameters:
+        candidates (list): files of an image, see get_image_candidates()
+        width (int): minimum width in pixels
+        density (float): minimum pixel density, used if width is None
+
+    Returns:
+        url (str): url of the selected file, the largest file if none is large enough,
+            None if there are no candidates
 
-    ValueError: if url is not valid
+    Raises:
+        None
     """
+    if not candidates:
+        return None
+    key = 'width' if width is not None else 'density'
+    minimum = width if width is not None else (density or 1.0)
 
-    # set up a result container
-    image_container = []
+    # candidates without the compared size can't be checked and come last
+    sized = sorted((candidate for candidate in candidates if candidate[key] is not None),
+                   key=lambda candidate: candidate[key])
+    if not sized:
+        return candidates[0]['url']
+    for candidate in sized:
+        if candidate[key] >= minimum:
+            return candidate['url']
 
-    # check response code when of the url
-    if requests.get(url).status_code != 200:
-        raise ValueError("url is not valid")
+    return sized[-1]['url']
 
-    # load page and get soup
-    page = requests.get(url).text
-    soup = BeautifulSoup(page, 'html5lib')
+
+def extract_images(soup, image_attributes={}, as_frame=True, url=None, candidates=False,
+                   width=None, density=None):
+    """Extract images from a parsed page, see scrape_images().
+
+    Parameters:
+        soup (bs4.BeautifulSoup): parsed page
+        image_attributes (dict): specification to get particular images
+        as_frame (bool): return a dataframe, otherwise a list of dicts without importing pandas
+        url (str): url of the page to resolve relative sources of the candidates
+        candidates (bool): add the column candidates with the files of each image
+        width (int): add the column selected with the smallest file at least this wide
+        density (float): add the column selected with the smallest file for this pixel density
+
+    Returns:
+        image_container (pd.DataFrame): dataframe containing the image data
+
+    Raises:
+        None
+    """
+    # set up a result container
+    image_container = []
 
     # find and iterate over images
     image_tags = soup.find_all('img', attrs=image_attributes)
     for image_tag in image_tags:
 
         # get image attributes as dict and add it to the result container
-        image_container.append(image_tag.attrs)
+        image = image_tag.attrs
+
+        # add the files of the image and the one that fits the requested size
+        if candidates or width is not None or density is not None:
+            image = dict(image)
+            image_candidates = get_image_candidates(image, url)
+            if candidates:
+                image['candidates'] = image_candidates
+            if width is not None or density is not None:
+                image['selected'] = select_image(
+                    image_candidates, width, density)
+        image_container.append(image)
 
     # transform result container into dataframe
-    image_container = pd.DataFrame(image_container)
+    if as_frame:
+        import pandas as pd
+        image_container = pd.DataFrame(image_container)
 
     return image_container
 
 
-def scrape_links(url, link_attributes={}, absolute_paths=False):
+def scrape_links(url, link_attributes={}, absolute_paths=False, as_frame=True, columns=None):
     """Scrape links from a static website.
 
     Parameters:
         url (str): url to a website
         link_attributes (dict): specification to get particular links
+        absolute_paths (bool): add the base url to relative hrefs
+        as_frame (bool): return a dataframe, otherwise a list of dicts without importing pandas
+        columns (list): attributes to keep as string columns, e.g. ['href', 'title'],
+            all attributes of all links by default
 
     Returns:
         link_container (pd.DataFrame): dataframe containing the link data
@@ -122,33 +417,118 @@ def scrape_links(url, link_attributes={}, absolute_paths=False):
     Raises:
         ValueError: if url is not valid
     """
+    # load page and get soup
+    soup = get_soup(url)
 
-    # set up a result container
-    link_container = []
+    return extract_links(soup, url, link_attributes, absolute_paths, as_frame, columns)
 
-    # check response code when of the url
-    if requests.get(url).status_code != 200:
-        raise ValueError("url is not valid")
 
-    # load page and get soup
-    page = requests.get(url).text
-    soup = BeautifulSoup(page, 'html5lib')
+def resolve_urls(url, hrefs):
+    """Resolve relative hrefs against a base url in one batch.
 
-    # find and iterate over images
+    Root-relative hrefs like "/wiki/France" are prefixed with the origin of the
+    base url, all other hrefs are resolved with urljoin once per distinct value.
+
+    Parameters:
+        url (str): base url
+        hrefs (list): hrefs to resolve, missing values are kept
+
+    Returns:
+        urls (list): absolute urls in the order of hrefs
+
+    Raises:
+        None
+    """
+    base = urllib.parse.urlsplit(url)
+    origin = base.scheme + '://' + base.netloc
+    resolved = {}
+
+    urls = []
+    for href in hrefs:
+        if not isinstance(href, str):
+            urls.append(href)
+
+        # plain root-relative paths only need the origin
+        elif href[:1] == '/' and href[1:2] != '/' and '/.' not in href and '\\' not in href \
+                and ';' not in href and '?#' not in href and href[-1] not in '?#' and href.isprintable():
+            urls.append(origin + href)
+        else:
+            if href not in resolved:
+                resolved[href] = urllib.parse.urljoin(url, href)
+            urls.append(resolved[href])
+
+    return urls
+
+
+def extract_links(soup, url, link_attributes={}, absolute_paths=False, as_frame=True, columns=None):
+    """Extract links from a parsed page, see scrape_links().
+
+    Parameters:
+        soup (bs4.BeautifulSoup): parsed page
+        url (str): url of the page to resolve relative hrefs
+        link_attributes (dict): specification to get particular links
+        absolute_paths (bool): add the base url to relative hrefs
+        as_frame (bool): return a dataframe, otherwise a list of dicts without importing pandas
+        columns (list): attributes to keep as string columns, all attributes by default
+
+    Returns:
+        link_container (pd.DataFrame): dataframe containing the link data
+
+    Raises:
+        None
+    """
+    # find and iterate over links
     link_tags = soup.find_all('a', attrs=link_attributes, href=True)
+
+    # collect only the named attributes column by column
+    if columns is not None:
+        link_container = {column: [] for column in columns}
+        for link_tag in link_tags:
+            attributes = link_tag.attrs
+            for column, values in link_container.items():
+                value = attributes.get(column)
+
+                # multi-valued attributes like class are joined like in the html
+                if isinstance(value, list):
+                    value = ' '.join(value)
+                values.append(value)
+
+        # add base url to relative hrefs in one batch
+        if absolute_paths == True and 'href' in link_container:
+            link_container['href'] = resolve_urls(url, link_container['href'])
+
+        if not as_frame:
+            return [dict(zip(link_container, values)) for values in zip(*link_container.values())]
+
+        import pandas as pd
+        link_container = pd.DataFrame({column: pd.array(values, dtype='string')
+                                       for column, values in link_container.items()},
+                                      columns=columns)
+
+        return link_container
+
+    # set up a result container
+    link_container = []
+
     for link_tag in link_tags:
 
-        # get image attributes as dict and add it to the result container
+        # get link attributes as dict and add it to the result container
         link_container.append(link_tag.attrs)
 
+    # add base url to relative hrefs in links
+    if absolute_paths == True:
+        hrefs = resolve_urls(url, [link['href'] for link in link_container])
+        link_container = [dict(link, href=href)
+                          for link, href in zip(link_container, hrefs)]
+
+    # return plain dicts on the fast path
+    if not as_frame:
+        return link_container
+
     # transform result container into dataframe
+    import pandas as pd
     link_container = pd.DataFrame(link_container)
 
-    # add base url to relative hrefs in links
-    if absolute_paths == True and 'href' in link_container:
-        link_container['href'] = link_container['href'].apply(
-            lambda x: urllib.parse.urljoin(url, x))
-
     return link_container
 
 
@@ -206,6 +586,13 @@ def test_scrape_images():
     assert test_data == assert_data, "Test expected '" + \
         assert_data + "' but got '" + test_data + "'"
 
+    # testcase: image with attributes, original file selected for a large width
+    images = scrape_images(url, image_attributes, width=10000)
+    assert_data = 'https://upload.wikimedia.org/wikipedia/commons/c/c3/Flag_of_France.svg'
+    test_data = images.loc[0, 'selected']
+    assert test_data == assert_data, "Test expected '" + \
+        assert_data + "' but got '" + test_data + "'"
+
     print("scrape_images() was tested successfully.")
 
 
@@ -234,6 +621,14 @@ def test_scrape_links():
     assert test_data == assert_data, "Test expected '" + \
         assert_data + "' but got '" + test_data + "'"
 
+    # testcase: link with attributes, with absolute paths, fixed columns
+    links = scrape_links(url, link_attributes, absolute_paths=True,
+                         columns=['href', 'title'])
+    assert_data = 'https://en.wikipedia.org/wiki/New_Guinea'
+    test_data = links.loc[0, 'href']
+    assert test_data == assert_data, "Test expected '" + \
+        assert_data + "' but got '" + test_data + "'"
+
     print("scrape_links() was tested successfully.")
 
 
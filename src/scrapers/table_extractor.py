@@ -0,0 +1,224 @@
+def is_hidden(tag):
+    """Check if a tag is hidden on the website.
+
+    Parameters:
+        tag (bs4.element.Tag): html tag
+
+    Returns:
+        hidden (bool): True for spans styled with display:none
+
+    Raises:
+        None
+    """
+    if tag.name != 'span':
+        return False
+    style = tag.get('style')
+    return style is not None and 'display:none' in style.replace(' ', '').lower()
+
+
+def get_cell_content(cell, display_none=False, links=None):
+    """Collect the text and the links of a table cell in one walk.
+
+    Parameters:
+        cell (bs4.element.Tag): td or th tag
+        display_none (bool): get data that is hidden on the website
+        links (list): container to append the hrefs of the cell to, None to skip links
+
+    Returns:
+        text (str): stripped text of the cell
+
+    Raises:
+        None
+    """
+    from bs4 import CData, NavigableString, Tag
+
+    texts = []
+    stack = [iter(cell.children)]
+
+    # walk the tree depth first without changing it
+    while stack:
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+        elif isinstance(child, Tag):
+            if not display_none and is_hidden(child):
+                continue
+            if links is not None and child.name == 'a' and child.has_attr('href'):
+                links.append(child['href'])
+            stack.append(iter(child.children))
+        elif type(child) in (NavigableString, CData):
+            texts.append(child)
+
+    return ''.join(texts).strip()
+
+
+def get_table_rows(table):
+    """Get the rows of a table without the rows of nested tables.
+
+    Parameters:
+        table (bs4.element.Tag): table tag
+
+    Returns:
+        table_rows (list): tr tags of the table
+
+    Raises:
+        None
+    """
+    from bs4 import Tag
+
+    table_rows = []
+    for child in table.children:
+        if not isinstance(child, Tag):
+            continue
+        if child.name == 'tr':
+            table_rows.append(child)
+        elif child.name in ('thead', 'tbody', 'tfoot'):
+            table_rows.extend(row for row in child.children
+                              if isinstance(row, Tag) and row.name == 'tr')
+
+    return table_rows
+
+
+def get_row_categories(table_rows):
+    """Get the section header of each table row in a single pass.
+
+    A row with the class "mergedtoprow" or without any class starts a new section,
+    the following rows with other classes belong to it.
+
+    Parameters:
+        table_rows (list): tr tags of a table
+
+    Returns:
+        categories (list): header text of the section of each row
+
+    Raises:
+        None
+    """
+    categories = []
+    category = None
+    for table_row in table_rows:
+
+        # carry the current section header forward
+        row_classes = table_row.get('class') or []
+        if 'mergedtoprow' in row_classes or not row_classes or category is None:
+            table_header = table_row.find('th')
+            category = table_header.text.strip() if table_header else ''
+        categories.append(category)
+
+    return categories
+
+
+def get_span(cell, attribute):
+    """Read the rowspan or colspan of a cell.
+
+    Parameters:
+        cell (bs4.element.Tag): td or th tag
+        attribute (str): "rowspan" or "colspan"
+
+    Returns:
+        span (int): number of rows or columns, at least 1
+
+    Raises:
+        None
+    """
+    try:
+        return max(1, int(str(cell.get(attribute, 1)).strip().rstrip(';')))
+    except ValueError:
+        return 1
+
+
+def advance_span(pending_spans, column):
+    """Use up one row of a pending span and move to the next column.
+
+    Parameters:
+        pending_spans (dict): column as key and remaining rows and text as value
+        column (int): column of the span
+
+    Returns:
+        column (int): next column
+
+    Raises:
+        None
+    """
+    pending_spans[column][0] -= 1
+    if pending_spans[column][0] == 0:
+        del pending_spans[column]
+    return column + 1
+
+
+def extract_table(table, display_none=False, append_links=False, append_categories=False):
+    """Extract a table into a rectangular grid in a single walk.
+
+    Cells spanning several rows or columns are repeated in each position they cover.
+
+    Parameters:
+        table (bs4.element.Tag): table tag
+        display_none (bool): get data that is hidden on the website
+        append_links (bool): get links from each row and append them in an extra column
+        append_categories (bool): get the section header of each row
+
+    Returns:
+        grid (list): one list of cell texts per row, with the list of links as last item
+            if append_links is set
+        categories (list): section header of each row, None if append_categories is not set
+
+    Raises:
+        None
+    """
+    from bs4 import Tag
+
+    table_rows = get_table_rows(table)
+    grid = []
+    row_links = []
+
+    # cells of previous rows that reach into the following rows, by column
+    pending_spans = {}
+    for table_row in table_rows:
+        row = []
+        links = [] if append_links else None
+        column = 0
+
+        for table_cell in table_row.children:
+            if not isinstance(table_cell, Tag) or table_cell.name not in ('td', 'th'):
+                continue
+
+            # skip columns that are covered by cells from above
+            while column in pending_spans:
+                row.append(pending_spans[column][1])
+                column = advance_span(pending_spans, column)
+
+            # parse the cell and spread it over its columns and rows
+            text = get_cell_content(table_cell, display_none, links)
+            rowspan = get_span(table_cell, 'rowspan')
+            for _ in range(get_span(table_cell, 'colspan')):
+                row.append(text)
+                if rowspan > 1:
+                    pending_spans[column] = [rowspan, text]
+                    column = advance_span(pending_spans, column)
+                else:
+                    column += 1
+
+        # fill the columns at the end of the row that are covered from above
+        while pending_spans and column <= max(pending_spans):
+            if column in pending_spans:
+                row.append(pending_spans[column][1])
+                column = advance_span(pending_spans, column)
+            else:
+                row.append(None)
+                column += 1
+
+        grid.append(row)
+        row_links.append(links)
+
+    # pad rows to a rectangle so that appended links share one column
+    width = max((len(row) for row in grid), default=0)
+    for row, links in zip(grid, row_links):
+        row.extend([None] * (width - len(row)))
+        if append_links:
+            row.append(links)
+
+    categories = get_row_categories(
+        table_rows) if append_categories else None
+
+    return grid, categories
+
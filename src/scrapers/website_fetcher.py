@@ -0,0 +1,347 @@
+import collections
+import concurrent.futures
+import threading
+import time
+
+import scrapers.rate_limiter as rl
+
+# requests is imported on first use to keep imports fast
+
+# one session per thread to reuse pooled connections
+_thread_data = threading.local()
+
+# futures of the pages that are currently fetched, one per url
+_pages_in_flight = {}
+_pages_in_flight_lock = threading.Lock()
+
+# archive that fetched pages are recorded to or replayed from
+_snapshots = {'archive': None, 'mode': None, 'at': None}
+
+# recently fetched pages, only kept while the page cache is in use
+_page_cache = {'max_age': None, 'max_pages': 0,
+               'pages': collections.OrderedDict()}
+_page_cache_lock = threading.Lock()
+
+
+class PageError(ValueError):
+    """Page that was answered with a status code other than 200.
+
+    Parameters:
+        message (str): description of the error
+        status_code (int): status code of the response
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_session():
+    """Get the requests session of the current thread.
+
+    Parameters:
+        None
+
+    Returns:
+        session (requests.Session): session with a pooled connection
+
+    Raises:
+        None
+    """
+    if not hasattr(_thread_data, 'session'):
+        import requests
+        _thread_data.session = requests.Session()
+    return _thread_data.session
+
+
+def get_retry_after(response):
+    """Read the Retry-After header of a response in seconds.
+
+    Parameters:
+        response (requests.Response): response of a host
+
+    Returns:
+        retry_after (float): seconds to wait, None if the header is missing
+
+    Raises:
+        None
+    """
+    header = response.headers.get('Retry-After')
+    if header is None:
+        return None
+
+    # the header holds either seconds or a http date
+    if header.strip().isdigit():
+        return float(header)
+    import email.utils
+    try:
+        retry_date = email.utils.parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+def request(url, headers=None, max_retries=5, timeout=30):
+    """Send a get request through the adaptive limiter of the host.
+
+    Parameters:
+        url (str): url to a website
+        headers (dict): additional request headers
+        max_retries (int): retries of throttled or failed requests
+        timeout (float): seconds to wait for the host
+
+    Returns:
+        response (requests.Response): last response of the host
+
+    Raises:
+        requests.RequestException: if the host can't be reached after all retries, right
+            away for errors that repeat, like an invalid url or too many redirects
+    """
+    import requests
+
+    limiter = rl.get_limiter(url)
+    for attempt in range(max_retries + 1):
+
+        # wait for a free slot of the host and time the request
+        limiter.acquire()
+        start = time.monotonic()
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout)
+        except requests.RequestException as error:
+            limiter.release(time.monotonic() - start)
+            if attempt == max_retries or not is_transient_error(error):
+                raise
+
+            # back off like for throttled responses, failures tend to come in bursts
+            time.sleep(min(60, 2 ** attempt))
+            continue
+
+        # report throttling to the limiter and retry after the backoff
+        retry_after = get_retry_after(response)
+        limiter.release(time.monotonic() - start,
+                        response.status_code, retry_after)
+        if response.status_code not in rl.THROTTLE_STATUS_CODES or attempt == max_retries:
+            break
+        if retry_after is None:
+            time.sleep(min(60, 2 ** attempt))
+
+    return response
+
+
+def is_transient_error(error):
+    """Check if a failed fetch is worth another try later on.
+
+    Parameters:
+        error (Exception): exception raised by get_page() or a scraper
+
+    Returns:
+        transient (bool): True for connection errors, timeouts, throttling and
+            server errors, False for errors that repeat, like missing pages or patterns
+
+    Raises:
+        None
+    """
+    if isinstance(error, PageError):
+        return error.status_code is not None and \
+            (error.status_code >= 500 or error.status_code in rl.THROTTLE_STATUS_CODES)
+
+    # requests is only imported by a fetch, without it there was no network error
+    import sys
+    requests = sys.modules.get('requests')
+    if requests is None:
+        return False
+    return isinstance(error, (requests.ConnectionError, requests.Timeout,
+                              requests.exceptions.ChunkedEncodingError))
+
+
+def use_snapshots(directory, mode='record', at=None):
+    """Record all fetched pages to a snapshot archive or replay them from it.
+
+    Parameters:
+        directory (str): directory of the archive, None to stop using snapshots
+        mode (str): "record" to store every fetched page, "replay" to serve pages
+            from the archive without any network access
+        at (float): unix time, replay the latest snapshots fetched at or before it
+
+    Returns:
+        archive (SnapshotArchive): opened archive, None if snapshots are turned off
+
+    Raises:
+        ValueError: if mode is not valid
+    """
+    import scrapers.snapshot_archive as sa
+
+    if mode not in ('record', 'replay'):
+        raise ValueError("mode is not valid")
+    if _snapshots['archive'] is not None:
+        _snapshots['archive'].close()
+
+    archive = sa.SnapshotArchive(directory) if directory else None
+    _snapshots.update(archive=archive, mode=mode if archive else None, at=at)
+
+    return archive
+
+
+def get_snapshot_archive():
+    """Get the snapshot archive in use.
+
+    Parameters:
+        None
+
+    Returns:
+        (archive, mode, at) (tuple): archive, mode and replay time, archive is None if
+            snapshots are not used
+
+    Raises:
+        None
+    """
+    return _snapshots['archive'], _snapshots['mode'], _snapshots['at']
+
+
+def use_page_cache(max_age=600, max_pages=1000):
+    """Keep fetched pages in memory and serve them again while they are fresh.
+
+    Parameters:
+        max_age (float): seconds a page is served from memory, None to stop caching
+        max_pages (int): number of pages kept, the least recently used pages are dropped
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    with _page_cache_lock:
+        _page_cache['max_age'] = max_age
+        _page_cache['max_pages'] = max_pages
+        if max_age is None:
+            _page_cache['pages'].clear()
+
+
+def clear_page_cache():
+    """Drop all pages of the page cache.
+
+    Parameters:
+        None
+
+    Returns:
+        count (int): number of dropped pages
+
+    Raises:
+        None
+    """
+    with _page_cache_lock:
+        count = len(_page_cache['pages'])
+        _page_cache['pages'].clear()
+
+    return count
+
+
+def get_cached_page(url):
+    """Get a fresh page from the page cache.
+
+    Parameters:
+        url (str): url to a website
+
+    Returns:
+        response (requests.Response): cached response, None if the page isn't cached or too old
+
+    Raises:
+        None
+    """
+    with _page_cache_lock:
+        if _page_cache['max_age'] is None or url not in _page_cache['pages']:
+            return None
+        fetched_at, response = _page_cache['pages'][url]
+        if time.monotonic() - fetched_at > _page_cache['max_age']:
+            del _page_cache['pages'][url]
+            return None
+        _page_cache['pages'].move_to_end(url)
+
+    return response
+
+
+def get_snapshot_response(url):
+    """Build a response from the latest snapshot of a page.
+
+    Parameters:
+        url (str): url to a website
+
+    Returns:
+        response (requests.Response): stored response
+
+    Raises:
+        ValueError: if the url has no snapshot
+    """
+    import requests
+
+    snapshot = _snapshots['archive'].get(url, _snapshots['at'])
+    if snapshot is None:
+        raise ValueError("url is not valid")
+
+    response = requests.Response()
+    response.url = url
+    response.status_code = snapshot['status_code']
+    response.headers.update(snapshot['headers'])
+    response._content = snapshot['content']
+    response.encoding = requests.utils.get_encoding_from_headers(
+        response.headers) or 'utf-8'
+
+    return response
+
+
+def get_page(url):
+    """Get the page of a website.
+
+    Concurrent calls for the same url share a single request.
+
+    Parameters:
+        url (str): url to a website
+
+    Returns:
+        response (requests.Response): response with status code 200
+
+    Raises:
+        PageError: if url is not valid, a subclass of ValueError
+    """
+    # serve fresh pages from memory if the page cache is in use
+    response = get_cached_page(url)
+    if response is not None:
+        return response
+
+    # wait for the result of a request that is already in flight
+    with _pages_in_flight_lock:
+        future = _pages_in_flight.get(url)
+        is_leader = future is None
+        if is_leader:
+            future = concurrent.futures.Future()
+            _pages_in_flight[url] = future
+    if not is_leader:
+        return future.result()
+
+    # send the request and hand the outcome to all waiting callers
+    try:
+        if _snapshots['mode'] == 'replay':
+            response = get_snapshot_response(url)
+        else:
+            response = request(url)
+        if response.status_code != 200:
+            raise PageError("url is not valid", response.status_code)
+        if _snapshots['mode'] == 'record':
+            _snapshots['archive'].store(url, response.content, response.status_code,
+                                        response.headers)
+        with _page_cache_lock:
+            if _page_cache['max_age'] is not None:
+                _page_cache['pages'][url] = (time.monotonic(), response)
+                _page_cache['pages'].move_to_end(url)
+                while len(_page_cache['pages']) > _page_cache['max_pages']:
+                    _page_cache['pages'].popitem(last=False)
+        future.set_result(response)
+    except BaseException as error:
+        future.set_exception(error)
+        raise
+    finally:
+        with _pages_in_flight_lock:
+            del _pages_in_flight[url]
+
+    return response
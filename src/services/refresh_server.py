@@ -0,0 +1,303 @@
+import concurrent.futures
+import http.server
+import json
+import os
+import socketserver
+import threading
+import time
+
+import country_data_scraping as cds
+import matchers.feature_matcher as fm
+import scrapers.static_website_scraper as sws
+import scrapers.website_fetcher as wf
+
+# finished jobs that are kept for GET /jobs/<id>
+MAX_JOBS = 100
+
+# directory that the outputs of jobs are written to
+DATA_DIRECTORY = 'data'
+
+
+def warm_up():
+    """Import the parsers and compile the matchers that every refresh needs.
+
+    Parameters:
+        None
+
+    Returns:
+        seconds (float): time of the warm up
+
+    Raises:
+        None
+    """
+    start = time.perf_counter()
+
+    # match a small infobox to import pandas, bs4 and html5lib
+    soup = sws.parse_page('<table class="infobox ib-country vcard"><tbody>'
+                          '<tr class="mergedtoprow"><th>Capital</th><td>-</td></tr>'
+                          '<tr class="mergedtoprow"><th colspan="2">Area</th></tr>'
+                          '<tr class="mergedrow"><th>• Total</th><td>1 km2</td></tr></tbody></table>')
+    tables = sws.extract_tables(soup, {'class': 'infobox ib-country vcard'},
+                                append_categories=True)
+    cds.match_state_attributes(tables, '', ['capital', 'area_total'])
+
+    # compile the matcher of the default attributes and read the overrides
+    fm.load_attribute_matcher(tuple(cds.get_attributes_list()))
+    cds.load_overrides()
+    wf.get_session()
+
+    return time.perf_counter() - start
+
+
+class RefreshService:
+    """Run refresh jobs one after another in a long-running process.
+
+    Jobs run on a single persistent thread, so that its connections, the page cache,
+    the parsed pages and the compiled patterns stay warm from one job to the next.
+    """
+
+    def __init__(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='refresh')
+        self.jobs = {}
+        self.futures = {}
+        self.count = 0
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+
+    def submit(self, request):
+        """Queue a refresh job.
+
+        Parameters:
+            request (dict): countries, attributes and parts to refresh, None or missing for all,
+                and output, a path relative to DATA_DIRECTORY to export the refreshed states to
+
+        Returns:
+            job (dict): id, status and request of the job
+
+        Raises:
+            ValueError: if the request is not valid
+        """
+        request = get_job_request(request)
+        with self.lock:
+            self.count += 1
+            job = {'id': str(self.count), 'status': 'queued', 'request': request,
+                   'submitted_at': time.time()}
+            self.jobs[job['id']] = job
+
+            # drop the oldest finished jobs
+            finished = [job_id for job_id, old_job in self.jobs.items()
+                        if old_job['status'] in ('done', 'failed')]
+            for job_id in finished[:max(0, len(self.jobs) - MAX_JOBS)]:
+                del self.jobs[job_id]
+                self.futures.pop(job_id, None)
+
+            self.futures[job['id']] = self.executor.submit(self.run_job, job)
+
+        return job
+
+    def run_job(self, job):
+        request = job['request']
+        job['status'] = 'running'
+        start = time.perf_counter()
+        try:
+            attributes_list = request['attributes'] or cds.get_attributes_list()
+            states = cds.get_selected_states(request['countries'])
+            states_dict, errors = cds.scrape_states(
+                states, attributes_list, tuple(request['parts']), backoff_seconds=0.5)
+            if request['output']:
+                cds.export_states(states_dict, attributes_list, request['output'])
+            job.update({'status': 'done', 'states': states_dict, 'errors': errors})
+        except Exception as error:
+            job.update({'status': 'failed', 'error': type(error).__name__ + ': ' + str(error)})
+        job['seconds'] = round(time.perf_counter() - start, 3)
+
+        return job
+
+    def wait(self, job_id, timeout=None):
+        """Wait for a job to finish.
+
+        Parameters:
+            job_id (str): id of the job
+            timeout (float): seconds to wait, None to wait until it is finished
+
+        Returns:
+            job (dict): the job, None if the id is unknown
+
+        Raises:
+            concurrent.futures.TimeoutError: if the job isn't finished in time
+        """
+        with self.lock:
+            future = self.futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+
+        return self.jobs.get(job_id)
+
+    def get_status(self):
+        """Describe the state of the service.
+
+        Parameters:
+            None
+
+        Returns:
+            status (dict): uptime and number of jobs by status
+
+        Raises:
+            None
+        """
+        with self.lock:
+            jobs = {}
+            for job in self.jobs.values():
+                jobs[job['status']] = jobs.get(job['status'], 0) + 1
+
+        return {'uptime_seconds': round(time.time() - self.started_at, 1), 'jobs': jobs}
+
+
+def get_job_request(request):
+    """Check a refresh request and fill in the defaults.
+
+    Parameters:
+        request (dict): body of POST /refresh
+
+    Returns:
+        request (dict): countries, attributes, parts and output, an absolute path in
+            DATA_DIRECTORY
+
+    Raises:
+        ValueError: if the request is not valid
+    """
+    if not isinstance(request, dict):
+        raise ValueError('request must be a json object')
+    unknown_keys = set(request) - {'countries', 'attributes', 'parts', 'output', 'wait'}
+    if unknown_keys:
+        raise ValueError('unknown keys: ' + ', '.join(sorted(unknown_keys)))
+
+    # lists of names, a missing list selects everything
+    for key in ['countries', 'attributes', 'parts']:
+        value = request.get(key)
+        if value is not None and not (isinstance(value, list) and
+                                      all(isinstance(item, str) for item in value)):
+            raise ValueError(key + ' must be a list of strings')
+    # outputs are only written into the data directory
+    output = request.get('output')
+    if output is not None:
+        if not (isinstance(output, str) and output.strip()):
+            raise ValueError('output must be a path')
+        data_directory = os.path.realpath(DATA_DIRECTORY)
+        output = os.path.realpath(os.path.join(data_directory, output))
+        if os.path.commonpath([output, data_directory]) != data_directory or output == data_directory:
+            raise ValueError('output must be a path in ' + DATA_DIRECTORY)
+    parts = request.get('parts') or list(cds.STATE_PARTS)
+    if set(parts) - set(cds.STATE_PARTS):
+        raise ValueError('unknown parts: ' + ', '.join(sorted(set(parts) - set(cds.STATE_PARTS))))
+
+    return {'countries': request.get('countries'), 'attributes': request.get('attributes'),
+            'parts': parts, 'output': output}
+
+
+class RefreshHandler(http.server.BaseHTTPRequestHandler):
+    """Json api of the refresh service.
+
+    GET /status, GET /jobs/<id>, POST /refresh with countries, attributes, parts,
+    output and wait (true by default), POST /cache/clear.
+    """
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/status':
+            return self.send_json(200, service.get_status())
+        if self.path.startswith('/jobs/'):
+            job = service.jobs.get(self.path[len('/jobs/'):])
+            if job is None:
+                return self.send_json(404, {'error': 'unknown job'})
+            return self.send_json(200, dict(job))
+
+        return self.send_json(404, {'error': 'unknown path'})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self.send_json(400, {'error': 'body is not valid json'})
+
+        if self.path == '/refresh':
+            try:
+                job = service.submit(request)
+            except ValueError as error:
+                return self.send_json(400, {'error': str(error)})
+
+            # small refreshes answer with their result, others are polled
+            if not request.get('wait', True):
+                return self.send_json(202, {'id': job['id'], 'status': job['status']})
+            return self.send_json(200, dict(service.wait(job['id'])))
+        if self.path == '/cache/clear':
+            return self.send_json(200, {'cleared_pages': wf.clear_page_cache()})
+
+        return self.send_json(404, {'error': 'unknown path'})
+
+    def send_json(self, status_code, data):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # clients of a unix socket have no address
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        print('request: ' + format % args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Http server on a unix socket, with a thread per connection."""
+
+    daemon_threads = True
+
+
+def serve(port=8780, socket_path=None, cache_seconds=600, max_pages=1000, max_soups=32):
+    """Run the refresh service until it is interrupted.
+
+    Parameters:
+        port (int): port of the http api on localhost, used if socket_path is None
+        socket_path (str): path of a unix socket for the http api
+        cache_seconds (float): seconds fetched pages are served from memory
+        max_pages (int): number of fetched pages kept in memory
+        max_soups (int): number of parsed pages kept in memory
+
+    Returns:
+        None
+
+    Raises:
+        OSError: if the port or the socket is in use
+    """
+    wf.use_page_cache(cache_seconds, max_pages)
+    sws.use_soup_cache(max_soups)
+    print('started: warm up in {0:.2f} s'.format(warm_up()))
+
+    # listen on a unix socket or on localhost only
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, RefreshHandler)
+        address = socket_path
+    else:
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', port), RefreshHandler)
+        server.daemon_threads = True
+        address = 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+    server.service = RefreshService()
+
+    print('started: refresh service at ' + address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)